@@ -2,55 +2,56 @@
 Common functions for default auth backend
 """
 import datetime
-import hashlib
-import hmac
 import json
+import time
 from base64 import b64decode, b64encode
 
-import itsdangerous
 import typing
 
-from crax.auth.models import AnonymousUser, User
+from crax.auth.cache import invalidate_user
+from crax.auth.hashers import get_hasher
+from crax.auth.models import AnonymousUser, AuthenticatedUser, User
 from crax.data_types import Request
 from crax.exceptions import CraxImproperlyConfigured
-from crax.utils import get_settings_variable
+from crax.signing import get_signer
+from crax.utils import get_settings_snapshot, get_settings_variable
 
 
 def create_password(password: str) -> str:
-    secret = get_settings_variable("SECRET_KEY")
-    if not secret:
-        raise CraxImproperlyConfigured(
-            '"SECRET_KEY" variable should be defined to use Authentication backends'
-        )
-    secret = secret.encode()
-    hashed = hashlib.pbkdf2_hmac("sha256", password.encode(), secret, 100000)
-    return hashed.hex()
+    return get_hasher().encode(password)
 
 
 def check_password(hashed: str, password: str) -> bool:
-    secret = get_settings_variable("SECRET_KEY")
-    if not secret:
-        raise CraxImproperlyConfigured(
-            '"SECRET_KEY" variable should be defined to use Authentication backends'
-        )
-    secret = secret.encode()
-    return hmac.compare_digest(
-        bytearray.fromhex(hashed),
-        hashlib.pbkdf2_hmac("sha256", password.encode(), secret, 100000),
-    )
+    return get_hasher().verify(hashed, password)
+
+
+async def hash_password(password: str) -> str:
+    return await get_hasher().hash(password)
+
+
+async def verify_password(hashed: str, password: str) -> bool:
+    return await get_hasher().check(hashed, password)
+
+
+_session_signers = {}
 
 
 def create_session_signer() -> tuple:
-    secret_key = get_settings_variable("SECRET_KEY")
-    if secret_key is None:
+    settings = get_settings_snapshot()
+    cached = _session_signers.get(settings.module)
+    if cached is not None and cached[0] is settings:
+        return cached[1]
+    signer = get_signer(settings)
+    if signer is None:
         raise CraxImproperlyConfigured(
             '"SECRET_KEY" string should be defined in settings to use Crax Sessions'
         )
-    signer = itsdangerous.TimestampSigner(str(secret_key), algorithm=itsdangerous.signer.HMACAlgorithm())
-    max_age = get_settings_variable("SESSION_EXPIRES", default=1209600)
-    cookie_name = get_settings_variable("SESSION_COOKIE_NAME", default="session_id")
-    same_site = get_settings_variable("SAME_SITE_COOKIE_MODE", default="lax")
-    return signer, max_age, cookie_name, same_site
+    max_age = settings.get("SESSION_EXPIRES", 1209600)
+    cookie_name = settings.get("SESSION_COOKIE_NAME", "session_id")
+    same_site = settings.get("SAME_SITE_COOKIE_MODE", "lax")
+    session_signer = (signer, max_age, cookie_name, same_site)
+    _session_signers[settings.module] = (settings, session_signer)
+    return session_signer
 
 
 def create_session_cookie(username: str, pk: int, session: str = None) -> tuple:
@@ -66,6 +67,20 @@ def create_session_cookie(username: str, pk: int, session: str = None) -> tuple:
     return session, session_cookie
 
 
+_anonymous_cookies = {}
+
+
+def create_anonymous_cookie() -> str:
+    # Cookie signed within the same second is the same, so it is reused
+    timestamp = str(int(time.time()))
+    key = (timestamp, create_session_signer())
+    cookie = _anonymous_cookies.get(key)
+    if cookie is None:
+        _anonymous_cookies.clear()
+        cookie = _anonymous_cookies[key] = create_session_cookie(timestamp, 0)[1]
+    return cookie
+
+
 async def set_user(
     request: Request, username: str, password: str, user_pk: int = 0
 ) -> None:
@@ -75,25 +90,24 @@ async def set_user(
     if user:
         hashed = user["password"]
         pk = user["id"]
-        res = check_password(hashed, password)
-        if res is True:
-            if user["last_name"] is not None:
-                full_name = f'{username} {user["first_name"]} {user["last_name"]}'
-            else:
-                full_name = f'{username} {user["first_name"]}'
-            request_user = User
-            request_user.pk = pk
-            request_user.username = username
-            request_user.is_staff = bool(user["is_staff"])
-            request_user.is_superuser = bool(user["is_superuser"])
-            request_user.is_active = bool(user["is_active"])
-            request_user.full_name = full_name
+        hasher = get_hasher()
+        secret = await hasher.match(hashed, password)
+        if secret is not None:
+            if secret != hasher.secret or hasher.needs_update(hashed):
+                query = (
+                    User.table.update()
+                    .where(User.c.id == pk)
+                    .values(password=await hasher.hash(password))
+                )
+                await User.query.execute(query=query)
+            await invalidate_user(pk)
             session_cookie = create_session_cookie(username, pk)[0]
             signed = {f"{username}:{pk}": session_cookie}
+            session = None
             if user_pk == 0:
                 request.session = json.dumps(signed)
-                request_user.session = signed
-            request.user = request_user()
+                session = signed
+            request.user = AuthenticatedUser.from_row(user, session=session)
         else:
             request.user = AnonymousUser()
     else:
@@ -102,9 +116,9 @@ async def set_user(
 
 async def login(
     request: Request, username: str, password: str
-) -> typing.Union[User, AnonymousUser]:
+) -> typing.Union[AuthenticatedUser, AnonymousUser]:
     secret = get_settings_variable("SECRET_KEY")
-    signer = itsdangerous.TimestampSigner(str(secret))
+    signer = get_signer()
     max_age = get_settings_variable("SESSION_EXPIRES", default=1209600)
     cookie_name = get_settings_variable("SESSION_COOKIE_NAME", default="session_id")
 
@@ -126,13 +140,16 @@ async def login(
 
 
 async def logout(request: Request) -> None:
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        await invalidate_user(user.pk)
     if "cookie" in request.headers:
         del request.headers["cookie"]
     request.user = None
 
 
 async def create_user(username: str, password: str, **kwargs) -> None:
-    password = create_password(password)
+    password = await hash_password(password)
     values = {
         "username": username,
         "password": password,
@@ -0,0 +1,136 @@
+"""
+Cache of authenticated users, so requests of logged in users do not query
+database every time. By default users are kept in memory of process with
+time to live and limited size, with permission sets of users stored under
+"permissions:<id>" keys. Shared cache (Redis, Memcached etc.) can be
+used with subclass of UserCache set as "backend" of "USER_CACHE" dictionary
+in project settings, other items of dictionary are passed to backend.
+"USER_CACHE" set to False disables cache. Cached users are invalidated on
+login, logout and write queries of User model: only changed user if query
+is filtered by primary key, all users otherwise.
+Invalidation of memory cache is seen only by process that made the change.
+If application runs in several worker processes, other workers keep serving
+changed user (e.g. deactivated one or one with revoked superuser status)
+until cached entry expires. So default time to live is 5 seconds: shared
+backend should be used to cache users longer with several workers.
+"""
+import time
+import typing
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from crax.auth.models import User
+from crax.exceptions import CraxImproperlyConfigured
+from crax.utils import Settings, get_settings_variable
+
+USER_FIELDS = [
+    "id",
+    "username",
+    "first_name",
+    "last_name",
+    "is_active",
+    "is_staff",
+    "is_superuser",
+]
+
+
+class UserCache(ABC):
+    @abstractmethod
+    async def get(
+        self, key: typing.Hashable
+    ) -> typing.Optional[dict]:  # pragma: no cover
+        pass
+
+    @abstractmethod
+    async def set(self, key: typing.Hashable, value: dict) -> None:  # pragma: no cover
+        pass
+
+    @abstractmethod
+    async def delete(self, key: typing.Hashable) -> None:  # pragma: no cover
+        pass
+
+    @abstractmethod
+    async def clear(self) -> None:  # pragma: no cover
+        pass
+
+
+class MemoryUserCache(UserCache):
+    def __init__(self, ttl: float = 5, max_size: int = 10000) -> None:
+        self.ttl = ttl
+        self.max_size = max_size
+        self.storage = OrderedDict()
+
+    async def get(self, key: typing.Hashable) -> typing.Optional[dict]:
+        item = self.storage.get(key)
+        if item is None:
+            return None
+        expires, value = item
+        if expires < time.monotonic():
+            self.storage.pop(key, None)
+            return None
+        self.storage.move_to_end(key)
+        return value
+
+    async def set(self, key: typing.Hashable, value: dict) -> None:
+        self.storage[key] = (time.monotonic() + self.ttl, value)
+        self.storage.move_to_end(key)
+        while len(self.storage) > self.max_size:
+            self.storage.popitem(last=False)
+
+    async def delete(self, key: typing.Hashable) -> None:
+        self.storage.pop(key, None)
+
+    async def clear(self) -> None:
+        self.storage.clear()
+
+
+def permissions_key(pk: int) -> str:
+    return f"permissions:{pk}"
+
+
+_user_caches = {}
+
+
+def get_user_cache(settings: Settings = None) -> typing.Optional[UserCache]:
+    options = get_settings_variable("USER_CACHE", default={}, settings=settings)
+    if options is False or options is None:
+        return None
+    options = dict(options)
+    backend = options.pop("backend", MemoryUserCache)
+    key = (backend, tuple(sorted(options.items())))
+    cache = _user_caches.get(key)
+    if cache is None:
+        if isinstance(backend, str):
+            spl_backend = backend.split(".")
+            try:
+                module = __import__(
+                    ".".join(spl_backend[:-1]), fromlist=spl_backend[:-1]
+                )
+                backend = getattr(module, spl_backend[-1])
+            except (ImportError, AttributeError, ValueError):
+                raise CraxImproperlyConfigured(f'Unknown user cache "{backend}"')
+        cache = _user_caches[key] = backend(**options)
+    return cache
+
+
+async def invalidate_user(pk: int = None, settings: Settings = None) -> None:
+    cache = get_user_cache(settings)
+    if cache is not None:
+        if pk is None:
+            await cache.clear()
+        else:
+            await cache.delete(pk)
+            await cache.delete(permissions_key(pk))
+
+
+async def on_user_write(model: typing.Any, pks: typing.Optional[list]) -> None:
+    if pks is None:
+        # Any row of users table could be changed
+        await invalidate_user()
+    else:
+        for pk in pks:
+            await invalidate_user(pk)
+
+
+if on_user_write not in User.query.on_write:
+    User.query.on_write.append(on_user_write)
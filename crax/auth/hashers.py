@@ -0,0 +1,173 @@
+"""
+Password hashers. PBKDF2 is CPU bound, so in async code passwords are hashed
+in thread pool executor (or process pool if "executor" is set to "process")
+and event loop is not blocked. Hasher is configured with "PASSWORD_HASHER"
+dictionary in project settings: "algorithm", "iterations", "executor" and
+"max_workers". Hashes are stored as "pbkdf2_<algorithm>$<iterations>$<salt>$<hash>"
+so hashes made with other parameters (or legacy hex hashes) are still checked
+and can be upgraded on login. Hashes are salted with "SECRET_KEY" as well. When
+secret key is rotated, old secrets should be kept in "SECRET_KEY_FALLBACKS":
+passwords are still checked with them and rehashed with new secret key on
+login. Users that do not log in before old secret is removed from fallbacks
+have to reset passwords.
+"""
+import asyncio
+import hashlib
+import hmac
+import secrets
+import typing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from crax.exceptions import CraxImproperlyConfigured
+from crax.utils import get_settings_variable
+
+LEGACY_ALGORITHM = "sha256"
+LEGACY_ITERATIONS = 100000
+
+
+def pbkdf2(algorithm: str, password: str, salt: str, iterations: int) -> bytes:
+    return hashlib.pbkdf2_hmac(algorithm, password.encode(), salt.encode(), iterations)
+
+
+_executors = {}
+
+
+def get_executor(kind: str = "thread", max_workers: int = None) -> Executor:
+    executor = _executors.get((kind, max_workers))
+    if executor is None:
+        if kind == "thread":
+            executor = ThreadPoolExecutor(max_workers, thread_name_prefix="crax-hasher")
+        elif kind == "process":
+            executor = ProcessPoolExecutor(max_workers)
+        else:
+            raise CraxImproperlyConfigured(f'Unknown password hasher executor "{kind}"')
+        _executors[(kind, max_workers)] = executor
+    return executor
+
+
+class PasswordHasher:
+    def __init__(
+        self,
+        secret: str,
+        algorithm: str = "sha256",
+        iterations: int = 100000,
+        executor: str = "thread",
+        max_workers: int = None,
+        old_secrets: typing.Iterable[str] = (),
+    ) -> None:
+        if algorithm not in hashlib.algorithms_available:
+            raise CraxImproperlyConfigured(f'Unknown hash algorithm "{algorithm}"')
+        self.secret = secret
+        self.old_secrets = list(old_secrets)
+        self.algorithm = algorithm
+        self.iterations = iterations
+        self.executor = executor
+        self.max_workers = max_workers
+
+    @staticmethod
+    def parse(encoded: str) -> typing.Tuple[str, int, str, str]:
+        # Legacy hashes are hex digests salted with secret key only
+        if "$" not in encoded:
+            return LEGACY_ALGORITHM, LEGACY_ITERATIONS, "", encoded
+        prefix, iterations, salt, hashed = encoded.split("$", 3)
+        return prefix[len("pbkdf2_") :], int(iterations), salt, hashed
+
+    def needs_update(self, encoded: str) -> bool:
+        try:
+            algorithm, iterations, _, _ = self.parse(encoded)
+        except ValueError:
+            return True
+        return (
+            "$" not in encoded
+            or algorithm != self.algorithm
+            or iterations != self.iterations
+        )
+
+    def create_arguments(self, password: str) -> tuple:
+        salt = secrets.token_hex(16)
+        return self.algorithm, password, salt, self.iterations
+
+    def parse_arguments(self, encoded: str, password: str) -> tuple:
+        algorithm, iterations, salt, _ = self.parse(encoded)
+        return algorithm, password, salt, iterations
+
+    @staticmethod
+    def format(arguments: tuple, hashed: bytes) -> str:
+        algorithm, _, salt, iterations = arguments
+        return f"pbkdf2_{algorithm}${iterations}${salt}${hashed.hex()}"
+
+    def compare(self, encoded: str, hashed: bytes) -> bool:
+        try:
+            expected = bytes.fromhex(self.parse(encoded)[3])
+        except ValueError:
+            return False
+        return hmac.compare_digest(expected, hashed)
+
+    def derive(self, arguments: tuple, secret: str = None) -> bytes:
+        algorithm, password, salt, iterations = arguments
+        if secret is None:
+            secret = self.secret
+        return pbkdf2(algorithm, password, salt + secret, iterations)
+
+    async def run(self, arguments: tuple, secret: str = None) -> bytes:
+        algorithm, password, salt, iterations = arguments
+        if secret is None:
+            secret = self.secret
+        loop = asyncio.get_event_loop()
+        executor = get_executor(self.executor, self.max_workers)
+        return await loop.run_in_executor(
+            executor, pbkdf2, algorithm, password, salt + secret, iterations
+        )
+
+    def encode(self, password: str) -> str:
+        arguments = self.create_arguments(password)
+        return self.format(arguments, self.derive(arguments))
+
+    def verify(self, encoded: str, password: str) -> bool:
+        # Malformed hash (or hash with unknown algorithm) matches no password
+        try:
+            arguments = self.parse_arguments(encoded, password)
+            for secret in [self.secret] + self.old_secrets:
+                if self.compare(encoded, self.derive(arguments, secret)):
+                    return True
+        except ValueError:
+            pass
+        return False
+
+    async def hash(self, password: str) -> str:
+        arguments = self.create_arguments(password)
+        return self.format(arguments, await self.run(arguments))
+
+    async def match(self, encoded: str, password: str) -> typing.Optional[str]:
+        # Returns secret key the hash was made with, None if password is wrong
+        try:
+            arguments = self.parse_arguments(encoded, password)
+            for secret in [self.secret] + self.old_secrets:
+                if self.compare(encoded, await self.run(arguments, secret)):
+                    return secret
+        except ValueError:
+            pass
+        return None
+
+    async def check(self, encoded: str, password: str) -> bool:
+        return await self.match(encoded, password) is not None
+
+
+_hashers = {}
+
+
+def get_hasher() -> PasswordHasher:
+    secret = get_settings_variable("SECRET_KEY")
+    if not secret:
+        raise CraxImproperlyConfigured(
+            '"SECRET_KEY" variable should be defined to use Authentication backends'
+        )
+    options = get_settings_variable("PASSWORD_HASHER", default={})
+    old_secrets = tuple(get_settings_variable("SECRET_KEY_FALLBACKS", default=()))
+    key = (secret, old_secrets, tuple(sorted(options.items())))
+    hasher = _hashers.get(key)
+    if hasher is None:
+        hasher = _hashers[key] = PasswordHasher(
+            secret, old_secrets=old_secrets, **options
+        )
+    return hasher
@@ -3,7 +3,6 @@ Authentication backend middleware classes that might be activated in project set
 """
 import binascii
 import json
-import time
 from base64 import b64decode
 
 import typing
@@ -11,9 +10,11 @@ import typing
 from crax.data_types import Request
 from itsdangerous import BadTimeSignature, SignatureExpired, BadSignature
 
-from crax.auth.models import User
+from crax.auth.cache import USER_FIELDS, get_user_cache
+from crax.auth.models import AuthenticatedUser, User
 from crax.auth.authentication import (
     AnonymousUser,
+    create_anonymous_cookie,
     create_session_signer,
     create_session_cookie,
 )
@@ -25,6 +26,19 @@ class AuthMiddleware(RequestMiddleware):
         super(AuthMiddleware, self).__init__(**kwargs)
         self.signer, self.max_age, self.cookie_name, _ = create_session_signer()
 
+    async def get_user(self, pk: int) -> typing.Optional[dict]:
+        cache = get_user_cache(self.request.settings)
+        if cache is not None:
+            user = await cache.get(pk)
+            if user is not None:
+                return user
+        query = User.select().where(User.c.id == pk)
+        user = await User.query.fetch_one(query=query)
+        if user and cache is not None:
+            user = {x: user[x] for x in USER_FIELDS}
+            await cache.set(pk, user)
+        return user
+
     async def process_headers(self) -> Request:
         if self.cookie_name in self.request.cookies:
             session_cookie = self.request.cookies[self.cookie_name]
@@ -34,28 +48,11 @@ class AuthMiddleware(RequestMiddleware):
                 user = user.decode("utf-8")
                 user_id = user.split(":")[1]
                 if user_id != "0":
-                    query = User.select().where(User.c.id == int(user_id))
-                    user = await User.query.fetch_one(query=query)
+                    user = await self.get_user(int(user_id))
                     if user:
-                        if user["last_name"] is not None:
-                            full_name = (
-                                f'{user["username"]}'
-                                f' {user["first_name"]} {user["last_name"]}'
-                            )
-                        else:
-                            full_name = f'{user["username"]} {user["first_name"]}'
-                        request_user = User
-                        request_user.pk = user["id"]
-                        request_user.username = user["username"]
-                        request_user.is_staff = bool(user["is_staff"])
-                        request_user.is_superuser = bool(user["is_superuser"])
-                        request_user.is_active = bool(user["is_active"])
-                        request_user.full_name = full_name
-                        request_user.session = self.request.cookies[self.cookie_name]
-                        self.request.user = User()
-                        self.request.user.session = self.request.cookies[
-                            self.cookie_name
-                        ]
+                        self.request.user = AuthenticatedUser.from_row(
+                            user, session=self.request.cookies[self.cookie_name]
+                        )
                     else:  # pragma: no cover
                         # Stupid case if user was removed from database but session cookies are sent
                         self.request.user = AnonymousUser()
@@ -75,7 +72,6 @@ class SessionMiddleware(ResponseMiddleware):
 
     async def process_headers(self) -> None:
         response = await super(SessionMiddleware, self).process_headers()
-        anonymous_cookie = create_session_cookie(str(int(time.time())), 0)[1]
         if self.request.session:
             session = json.loads(self.request.session)
             session_value = list(session.values())[0]
@@ -88,7 +84,7 @@ class SessionMiddleware(ResponseMiddleware):
                         spl[0], spl[1], session=session_value
                     )[1]
                 else:
-                    cookie = anonymous_cookie
+                    cookie = create_anonymous_cookie()
                 self.request.session = {}
             except (
                 binascii.Error,
@@ -96,7 +92,7 @@ class SessionMiddleware(ResponseMiddleware):
                 BadSignature,
                 SignatureExpired,
             ):
-                cookie = anonymous_cookie
+                cookie = create_anonymous_cookie()
             self.headers.append((b"Set-Cookie", cookie.encode("latin-1")))
         else:
             if self.cookie_name in self.request.cookies:
@@ -112,11 +108,11 @@ class SessionMiddleware(ResponseMiddleware):
                 ):  # pragma: no cover
                     # No need to cover this case 'cause same cases covered above several times
                     self.headers.append(
-                        (b"Set-Cookie", anonymous_cookie.encode("latin-1"))
+                        (b"Set-Cookie", create_anonymous_cookie().encode("latin-1"))
                     )
             else:
                 self.headers.append(
-                    (b"Set-Cookie", anonymous_cookie.encode("latin-1"))
+                    (b"Set-Cookie", create_anonymous_cookie().encode("latin-1"))
                 )
         response.headers += self.headers
         return response
@@ -1,6 +1,8 @@
 """
 Common models for authentication backend
 """
+import typing
+
 try:
     from sqlalchemy import (
         MetaData,
@@ -136,3 +138,79 @@ class AnonymousUser:
     @property
     def session(self) -> None:
         return None
+
+    @property
+    def permissions(self) -> typing.FrozenSet[str]:
+        return frozenset()
+
+    def has_permissions(self, permissions: typing.Iterable[str]) -> bool:
+        return False
+
+
+class AuthenticatedUser:
+    # Created for every request, so data of users of concurrent requests
+    # is never shared. Slots make it cheaper than model instance.
+    __slots__ = (
+        "pk",
+        "username",
+        "first_name",
+        "last_name",
+        "full_name",
+        "is_active",
+        "is_staff",
+        "is_superuser",
+        "session",
+        "permissions",
+    )
+
+    def __init__(
+        self,
+        pk: int,
+        username: str,
+        first_name: str = None,
+        last_name: str = None,
+        is_active: bool = True,
+        is_staff: bool = False,
+        is_superuser: bool = False,
+        session: typing.Any = None,
+    ) -> None:
+        self.pk = pk
+        self.username = username
+        self.first_name = first_name
+        self.last_name = last_name
+        self.is_active = bool(is_active)
+        self.is_staff = bool(is_staff)
+        self.is_superuser = bool(is_superuser)
+        self.session = session
+        self.permissions = None
+        if last_name is not None:
+            self.full_name = f"{username} {first_name} {last_name}"
+        else:
+            self.full_name = f"{username} {first_name}"
+
+    @classmethod
+    def from_row(
+        cls, row: typing.Mapping, session: typing.Any = None
+    ) -> "AuthenticatedUser":
+        return cls(
+            row["id"],
+            row["username"],
+            first_name=row["first_name"],
+            last_name=row["last_name"],
+            is_active=row["is_active"],
+            is_staff=row["is_staff"],
+            is_superuser=row["is_superuser"],
+            session=session,
+        )
+
+    @property
+    def is_authenticated(self) -> bool:
+        return True
+
+    def has_permissions(self, permissions: typing.Iterable[str]) -> bool:
+        if self.is_superuser:
+            return True
+        return self.permissions is not None and self.permissions.issuperset(permissions)
+
+    def __str__(self) -> str:
+        return self.full_name
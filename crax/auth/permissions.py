@@ -0,0 +1,90 @@
+"""
+Permission engine. Effective permissions of user (granted directly and
+through groups) are fetched with one query and cached in user cache until
+user logs in, logs out or any permission related table is changed. Every
+permission grants its name and "<model>.<action>" codes for actions allowed
+with "can_read", "can_write", "can_create" and "can_delete" columns. Views
+require permissions with "permissions_required" list of such codes.
+"""
+import typing
+
+try:
+    from sqlalchemy import select, union
+except ImportError:  # pragma: no cover
+    raise
+
+from crax.auth.cache import get_user_cache, permissions_key
+from crax.auth.models import (
+    GroupPermission,
+    Permission,
+    UserGroup,
+    UserPermission,
+)
+from crax.utils import Settings
+
+PERMISSION_ACTIONS = ["read", "write", "create", "delete"]
+
+
+def create_permissions_query(pk: int) -> typing.Any:
+    direct = (
+        select([Permission.table])
+        .select_from(
+            UserPermission.table.join(
+                Permission.table, UserPermission.c.permission_id == Permission.c.id
+            )
+        )
+        .where(UserPermission.c.user_id == pk)
+    )
+    grouped = (
+        select([Permission.table])
+        .select_from(
+            GroupPermission.table.join(
+                Permission.table, GroupPermission.c.permission_id == Permission.c.id
+            ).join(UserGroup.table, UserGroup.c.group_id == GroupPermission.c.group_id)
+        )
+        .where(UserGroup.c.user_id == pk)
+    )
+    return union(direct, grouped)
+
+
+def get_permission_codes(row: typing.Mapping) -> typing.List[str]:
+    codes = [row["name"]]
+    for action in PERMISSION_ACTIONS:
+        if row[f"can_{action}"]:
+            codes.append(f'{row["model"]}.{action}')
+    return codes
+
+
+async def fetch_permissions(pk: int) -> typing.FrozenSet[str]:
+    # Permissions are read from primary database, so changes are not missed
+    # because of replication lag after cache is invalidated
+    rows = await Permission.query.fetch_all(
+        query=create_permissions_query(pk), primary=True
+    )
+    return frozenset(x for row in rows or [] for x in get_permission_codes(row))
+
+
+async def get_permissions(pk: int, settings: Settings = None) -> typing.FrozenSet[str]:
+    if not pk:
+        return frozenset()
+    cache = get_user_cache(settings)
+    if cache is not None:
+        cached = await cache.get(permissions_key(pk))
+        if cached is not None:
+            return frozenset(cached)
+    permissions = await fetch_permissions(pk)
+    if cache is not None:
+        # Stored as list, so shared cache backends can serialize it
+        await cache.set(permissions_key(pk), sorted(permissions))
+    return permissions
+
+
+async def on_permission_write(model: typing.Any, pks: typing.Optional[list]) -> None:
+    cache = get_user_cache()
+    if cache is not None:
+        await cache.clear()
+
+
+for model in [Permission, UserPermission, GroupPermission, UserGroup]:
+    if on_permission_write not in model.query.on_write:
+        model.query.on_write.append(on_permission_write)
@@ -0,0 +1,42 @@
+"""
+Command to precompile Crax and project applications templates to python modules.
+Set "TEMPLATE_MODULES" variable to the target directory to make template views
+load precompiled templates instead of compiling them at runtime.
+"""
+import sys
+
+from crax.commands.command import BaseCommand
+from crax.exceptions import CraxImproperlyConfigured
+from crax.utils import get_settings_snapshot
+from crax.views import TemplateEngine
+
+options = [
+    (
+        ["--target", "-t"],
+        {"type": str, "help": "directory to write precompiled templates to"},
+    ),
+]
+
+
+class CompileTemplates(BaseCommand):
+    def __init__(self, opts=None) -> None:
+        super(CompileTemplates, self).__init__(opts)
+        sys.path = ["", ".."] + sys.path[1:]
+        settings = get_settings_snapshot()
+        self.target = getattr(self.args, "target", None) or settings.get(
+            "TEMPLATE_MODULES"
+        )
+        if not self.target:
+            raise CraxImproperlyConfigured(
+                "'TEMPLATE_MODULES' variable should be defined in configuration"
+                " file or '--target' option given to compile templates"
+            )
+        self.engine = TemplateEngine(settings)
+
+    def compile_templates(self) -> None:
+        self.engine.compile_templates(self.target)
+
+
+if __name__ == "__main__":  # pragma: no cover
+    compile_templates = CompileTemplates(options).compile_templates
+    compile_templates()
@@ -0,0 +1,39 @@
+"""
+Command to create precompressed ".gz" (and ".br" if brotli package installed)
+copies of static files from "STATIC_DIRS" and Crax swagger static files.
+Static files are served precompressed to clients that accept it.
+"""
+import sys
+
+from crax.commands.command import BaseCommand
+from crax.static import StaticFiles
+from crax.utils import get_settings_snapshot
+
+options = [
+    (
+        ["--min-size", "-m"],
+        {"type": int, "default": 256, "help": "minimal size of file to compress"},
+    ),
+    (
+        ["--force", "-f"],
+        {"help": "recreate existing files", "action": "store_true", "dest": "force"},
+    ),
+]
+
+
+class CompressStatic(BaseCommand):
+    def __init__(self, opts=None) -> None:
+        super(CompressStatic, self).__init__(opts)
+        sys.path = ["", ".."] + sys.path[1:]
+        self.static_files = StaticFiles.from_settings(get_settings_snapshot())
+        self.min_size = getattr(self.args, "min_size", 256)
+        self.force = getattr(self.args, "force", False)
+
+    def compress_static(self) -> None:
+        for path in self.static_files.compress(self.min_size, self.force):
+            sys.stdout.write(f"{path}\n")
+
+
+if __name__ == "__main__":  # pragma: no cover
+    compress_static = CompressStatic(options).compress_static
+    compress_static()
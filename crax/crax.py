@@ -3,7 +3,9 @@ Project facade. All application work starts here. Several important
 steps:
 Start and Shutdown scripts ran.
 Detected request type.
-Request object created from each request's Scope object.
+Request object created from each request's Scope object. Everything that
+belongs to the request is kept in it's own RequestContext, so application
+instance is never modified while requests are processed.
 Project settings passed to environment.
 Logging system activated.
 Request object modified with request middleware.
@@ -12,14 +14,25 @@ Checked if there were no errors.
 import inspect
 import os
 import sys
+from dataclasses import dataclass
 
 import typing
 from crax.data_types import Scope, Receive, Send
 from crax.form_data import FormData
+from crax.middleware.base import MiddlewareChain
 from crax.request import Request
 from crax.response import Response
-from crax.utils import collect_middleware, get_error_handler, get_settings_variable
-from crax.views import DefaultError
+from crax.static import StaticFiles
+from crax.urls import Router
+from crax.utils import Settings, get_error_handler, reload_settings
+from crax.views import DefaultError, get_template_engine
+
+
+@dataclass
+class RequestContext:
+    request: Request
+    errors: typing.Any = None
+    status_code: typing.Optional[int] = None
 
 
 class Crax:
@@ -33,21 +46,26 @@ class Crax:
         self.debug = debug
         self.on_startup = on_startup
         self.errors = None
-        self.request = None
         self.app_logger = None
         self.status_code = None
         self.db_connections = {}
+        self.config = None
+        self.router = None
+        self.middleware = None
+        self.static_files = None
 
         if not settings:
             os.environ["CRAX_SETTINGS"] = "crax.conf"
+            self.reload_settings()
         else:
             try:
                 __import__(settings)
                 os.environ["CRAX_SETTINGS"] = settings
-                disable_logging = get_settings_variable("DISABLE_LOGS", default=True)
+                self.reload_settings()
+                disable_logging = self.config.get("DISABLE_LOGS", True)
                 if disable_logging is False:
-                    logging_backend = get_settings_variable(
-                        "LOGGING_BACKEND", default="crax.logger.CraxLogger"
+                    logging_backend = self.config.get(
+                        "LOGGING_BACKEND", "crax.logger.CraxLogger"
                     )
                     spl_middleware = logging_backend.split(".")
                     module = __import__(
@@ -61,81 +79,100 @@ class Crax:
                 self.errors = ex
                 self.status_code = 500
 
-    @staticmethod
-    def process_resp_middleware(app, middleware_list):
-        for cls in middleware_list:
-            app = cls(app=app)
-        return app
-
-    async def process_middleware(self, base):
-        middleware_list = await collect_middleware(base)
-        if isinstance(middleware_list, list) and middleware_list:
-            for middleware in middleware_list:
-                processed = await middleware(request=self.request).process_headers()
-                try:
-                    self.request, self.errors = processed
-                except TypeError:
-                    if isinstance(processed, Request):
-                        self.request = processed
-                    else:
-                        self.errors = processed
-        elif not isinstance(middleware_list, list):
-            self.errors = middleware_list
-            self.status_code = 500
+    def reload_settings(self) -> Settings:
+        self.config = reload_settings(self.settings or "crax.conf")
+        self.router = Router(self.config.get("URL_PATTERNS"))
+        self.middleware = MiddlewareChain(self.config.get("MIDDLEWARE"))
+        self.static_files = StaticFiles.from_settings(self.config, debug=self.debug)
+        get_template_engine(self.config, auto_reload=self.debug)
+        return self.config
+
+    async def process_middleware(self, context: RequestContext) -> None:
+        if self.middleware.error is not None:
+            context.errors = self.middleware.error
+            context.status_code = 500
+        else:
+            context.request, context.errors = await self.middleware.process_request(
+                context.request
+            )
 
-    async def process_errors(self, scope, receive, send):
-        if self.status_code is not None:
-            self.request.status_code = self.status_code
+    async def process_errors(
+        self, scope: Scope, receive: Receive, send: Send, context: RequestContext
+    ) -> None:
+        request = context.request
+        if context.status_code is not None:
+            request.status_code = context.status_code
 
         if self.app_logger is not None:
-            self.app_logger.critical(self.errors, exc_info=True)
+            self.app_logger.critical(context.errors, exc_info=True)
         if self.debug is True:
-            response = DefaultError(self.request, self.errors)
+            response = DefaultError(request, context.errors)
             await response(scope, receive, send)
         else:
-            response = get_error_handler(self.errors)
+            response = get_error_handler(context.errors)
             if response is not None:
                 try:
                     await response(scope, receive, send)
                 except TypeError:
-                    _response = response(self.request)
+                    _response = response(request)
                     await _response(scope, receive, send)
 
-    async def _receive(self, receive: Receive) -> typing.AsyncGenerator:
+    @staticmethod
+    async def _receive(receive: Receive) -> typing.AsyncGenerator:
         more_body = True
         while more_body:
-            self.rec = await receive()
-            more_body = self.rec.get("more_body", False)
-            if self.rec["type"] == "http.request":
-                body = self.rec.get("body", b"")
+            message = await receive()
+            more_body = message.get("more_body", False)
+            if message["type"] == "http.request":
+                body = message.get("body", b"")
                 if body:
                     yield body
-            elif self.rec["type"] == "http.disconnect":  # pragma: no cover
+            elif message["type"] == "http.disconnect":  # pragma: no cover
                 break
         yield b""
 
-    async def process_request(self, scope: Scope, receive: Receive, send: Send) -> None:
-
-        if self.errors is None:
-            await self.process_middleware("RequestMiddleware")
-            if self.errors is None:
-                app = Response(self.request, self.debug)
-                if scope["type"] in ["http", "http.request"]:
-                    middleware_list = await collect_middleware("ResponseMiddleware")
-                    app = self.process_resp_middleware(app, middleware_list)
-                await app(scope, receive, send)
-            else:
-                await self.process_errors(scope, receive, send)
-                self.errors = None
+    async def process_request(
+        self, scope: Scope, receive: Receive, send: Send, context: RequestContext
+    ) -> None:
+        if context.errors is None:
+            await self.process_middleware(context)
+        if context.errors is None:
+            app = Response(
+                context.request,
+                self.debug,
+                router=self.router,
+                settings=self.config,
+                static_files=self.static_files,
+            )
+            if scope["type"] in ["http", "http.request"]:
+                app = self.middleware.wrap(app)
+            await app(scope, receive, send)
         else:
-            await self.process_errors(scope, receive, send)
-            self.errors = None
+            await self.process_errors(scope, receive, send, context)
 
     async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
         if scope["type"] == "lifespan":
-            databases = get_settings_variable('DATABASES')
+            databases = None
+            if self.errors is None:
+                databases = self.config.get("DATABASES")
             message = await receive()
             if message["type"] == "lifespan.startup":
+                if self.errors is None:
+                    # Settings module could be not fully imported at the
+                    # moment application was created, so snapshot is rebuilt.
+                    databases = self.reload_settings().get("DATABASES")
+                    if self.middleware.error is not None:
+                        error_message = f"MIDDLEWARE ERROR: {self.middleware.error}"
+                        sys.stdout.write(f"\033[31m{error_message}\033[0m \n")
+                        if self.app_logger is not None:
+                            self.app_logger.critical(self.middleware.error)
+                        await send(
+                            {
+                                "type": "lifespan.startup.failed",
+                                "message": error_message,
+                            }
+                        )
+                        return
                 if databases:
                     from crax.database.connection import create_connections
                     self.db_connections = await create_connections()
@@ -149,29 +186,32 @@ class Crax:
                 await send({"type": "lifespan.startup.complete"})
             elif message["type"] == "lifespan.shutdown":
                 if databases:
-                    from crax.database.connection import close_pool
+                    from crax.database.connection import close_pool, connection_registry
                     await close_pool(self.db_connections)
+                    await connection_registry.close()
                 await send({"type": "lifespan.shutdown.complete"})
 
         elif scope["type"] in ["http", "websocket"]:
-            self.request = Request(scope)
+            request = Request(scope, settings=self.config)
+            context = RequestContext(
+                request=request, errors=self.errors, status_code=self.status_code
+            )
             if "method" in scope and scope["method"] in ["POST", "PATCH"]:
-                form_data = FormData(self.request, self._receive(receive))
+                form_data = FormData(request, self._receive(receive))
                 await form_data.process()
 
             if self.app_logger is not None:
-                client = self.request.client
-                server = self.request.server
-                method = self.request.method
-                user_agent = self.request.headers.get("user-agent", "Unknown")
+                client = request.client
+                server = request.server
+                method = request.method
+                user_agent = request.headers.get("user-agent", "Unknown")
                 message = f'{scope["type"]} {method} {server} {client} {user_agent} {scope["path"]}'
                 self.app_logger.info(message)
             try:
-                await self.process_request(scope, receive, send)
+                await self.process_request(scope, receive, send, context)
             except Exception as ex:
-                self.status_code = 500
-                self.errors = ex
-                await self.process_errors(scope, receive, send)
-                self.errors = None
+                context.status_code = 500
+                context.errors = ex
+                await self.process_errors(scope, receive, send, context)
         else:
             raise NotImplementedError("Unknown request type")  # pragma: no cover
@@ -1,4 +1,24 @@
-from dataclasses import dataclass
+"""
+Database connections. Connections created on application startup are stored
+in application. Queries running outside of application lifespan (background
+workers, scripts) use process wide registry of lazily created connection
+pools, keyed by database alias. Pool options can be set for every database
+as "pool" dictionary: "min_size", "max_size", "idle_timeout" (seconds before
+idle connection is closed) and "health_check_interval" (seconds between
+checks of pool on checkout). Read queries can be routed to replicas listed
+in database "replicas" list: every replica is a dictionary of connection
+parameters that differ from primary database ones. Replica is chosen with
+"round_robin" (default) or "latency" strategy set as "replica_selection".
+With "latency" strategy every tenth read is sent to the next replica in turn,
+so latency of replicas that are not chosen is measured again. Writes, queries
+inside of transactions and reads called with "primary=True" are sent to
+primary database.
+"""
+import asyncio
+from dataclasses import dataclass, field
+import logging
+import sqlite3
+import time
 import typing
 
 from databases import Database
@@ -12,17 +32,90 @@ except ImportError:  # pragma: no cover
 
 from crax.utils import get_settings
 
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
+try:
+    import pymysql
+except ImportError:
+    pymysql = None
+
+logger = logging.getLogger(__name__)
+
+DATABASE_ERRORS = [OSError, asyncio.TimeoutError, sqlite3.Error]
+if asyncpg is not None:
+    DATABASE_ERRORS += [asyncpg.PostgresError, asyncpg.InterfaceError]
+if pymysql is not None:
+    DATABASE_ERRORS.append(pymysql.Error)
+DATABASE_ERRORS = tuple(DATABASE_ERRORS)
+
+POOL_OPTIONS = {
+    "min_size": 1,
+    "max_size": 10,
+    "idle_timeout": 300,
+    "health_check_interval": 30,
+}
+REPLICA_SELECTION = ["round_robin", "latency"]
+LATENCY_PROBE_INTERVAL = 10
+IDLE_TIMEOUT_OPTIONS = {
+    "postgresql": "max_inactive_connection_lifetime",
+    "postgres": "max_inactive_connection_lifetime",
+    "mysql": "pool_recycle",
+}
+
 
 @dataclass
 class Connection:
     pool: typing.Any = None
     driver: str = None
     main: bool = True
+    health_check_interval: float = None
+    checked: float = 0
+    loop: typing.Any = None
+    replicas: typing.List["Connection"] = field(default_factory=list)
+    replica_selection: str = "round_robin"
+    counter: int = 0
+    latency: float = 0
 
+    def in_transaction(self) -> bool:
+        # Transaction state is kept in private attributes of "databases"
+        # package. If they are missed, query is sent to primary database
+        if getattr(self.pool, "_global_connection", None) is not None:
+            return True
+        try:
+            connection = self.pool._connection_context.get(None)
+        except AttributeError:
+            return True
+        if connection is None:
+            return False
+        return bool(getattr(connection, "_transaction_stack", True))
 
-async def create_connections() -> dict:
-    configuration = get_settings()
-    connections = {}
+    def get_replica(self) -> "Connection":
+        if not self.replicas or self.in_transaction():
+            return self
+        self.counter += 1
+        if self.replica_selection == "latency":
+            if self.counter % LATENCY_PROBE_INTERVAL:
+                return min(self.replicas, key=lambda x: x.latency)
+            index = self.counter // LATENCY_PROBE_INTERVAL
+        else:
+            index = self.counter - 1
+        return self.replicas[index % len(self.replicas)]
+
+    def record_latency(self, elapsed: float) -> None:
+        # Moving average, so single slow query does not exclude replica forever
+        if self.latency:
+            self.latency = self.latency * 0.8 + elapsed * 0.2
+        else:
+            self.latency = elapsed
+
+    def get_pools(self) -> typing.List[Database]:
+        return [self.pool] + [x.pool for x in self.replicas]
+
+
+def get_databases(configuration: typing.Any) -> dict:
     if not hasattr(configuration, "DATABASES"):
         raise CraxDataBaseImproperlyConfigured(
             "Improperly configured project settings. "
@@ -40,34 +133,88 @@ async def create_connections() -> dict:
             "Improperly configured project settings. "
             'DATABASES dictionary should contain "default" database'
         )
-    for table in configuration.DATABASES:
-        table_base = configuration.DATABASES[table]
-        driver = table_base["driver"]
+    return databases
 
-        if "options" in table_base:
-            connection_options = table_base["options"]
-        else:
-            connection_options = {}
-        if table_base["driver"] != 'sqlite':
-            port = table_base.get('port')
-            if port:
-                connection_string = (
-                    f'{table_base["driver"]}://{table_base["user"]}:'
-                    f'{table_base["password"]}@{table_base["host"]}:{port}/{table_base["name"]}'
-                )
-            else:
-                connection_string = (
-                    f'{table_base["driver"]}://{table_base["user"]}:'
-                    f'{table_base["password"]}@{table_base["host"]}/{table_base["name"]}'
-                )
+
+def create_connection_string(table_base: dict) -> str:
+    if table_base["driver"] != "sqlite":
+        port = table_base.get("port")
+        if port:
+            connection_string = (
+                f'{table_base["driver"]}://{table_base["user"]}:'
+                f'{table_base["password"]}@{table_base["host"]}:{port}/{table_base["name"]}'
+            )
         else:
             connection_string = (
-                f'{table_base["driver"]}://{table_base["name"]}'
+                f'{table_base["driver"]}://{table_base["user"]}:'
+                f'{table_base["password"]}@{table_base["host"]}/{table_base["name"]}'
             )
-        connection = Database(connection_string, **connection_options)
-        await connection.connect()
+    else:
+        connection_string = f'{table_base["driver"]}://{table_base["name"]}'
+    return connection_string
+
+
+def create_database(table_base: dict, pool_options: dict = None) -> Database:
+    driver = table_base["driver"]
+    if "options" in table_base:
+        connection_options = dict(table_base["options"])
+    else:
+        connection_options = {}
+    if pool_options and driver != "sqlite":
+        # SQLite has no pool, all options are passed to sqlite3.connect
+        for option in ["min_size", "max_size"]:
+            if pool_options.get(option) is not None:
+                connection_options.setdefault(option, pool_options[option])
+        idle_option = IDLE_TIMEOUT_OPTIONS.get(driver)
+        if idle_option is not None and pool_options.get("idle_timeout") is not None:
+            connection_options.setdefault(idle_option, pool_options["idle_timeout"])
+    return Database(create_connection_string(table_base), **connection_options)
+
+
+async def connect_database(
+    table_base: dict, pool_options: dict = None, **kwargs: typing.Any
+) -> Connection:
+    replica_selection = table_base.get("replica_selection", "round_robin")
+    if replica_selection not in REPLICA_SELECTION:
+        raise CraxDataBaseImproperlyConfigured(
+            "Improperly configured project settings. "
+            f'Unknown replica selection "{replica_selection}"'
+        )
+    primary = {
+        k: v
+        for k, v in table_base.items()
+        if k not in ["replicas", "replica_selection"]
+    }
+    database = create_database(primary, pool_options)
+    await database.connect()
+    connection = Connection(
+        pool=database,
+        driver=table_base["driver"],
+        replica_selection=replica_selection,
+        **kwargs,
+    )
+    for replica in table_base.get("replicas", []):
+        database = create_database({**primary, **replica}, pool_options)
+        await database.connect()
+        connection.replicas.append(
+            Connection(pool=database, driver=table_base["driver"])
+        )
+    return connection
+
+
+async def disconnect_database(connection: Connection) -> None:
+    for pool in connection.get_pools():
+        if pool.is_connected:
+            await pool.disconnect()
+
 
-        connection = Connection(pool=connection, driver=driver)
+async def create_connections() -> dict:
+    configuration = get_settings()
+    connections = {}
+    databases = get_databases(configuration)
+    for table in databases:
+        table_base = databases[table]
+        connection = await connect_database(table_base, table_base.get("pool"))
         connections[table] = connection
 
     return connections
@@ -75,5 +222,98 @@ async def create_connections() -> dict:
 
 async def close_pool(connections):
     if connections:
+        if isinstance(connections, dict):
+            connections = connections.values()
         for connection in connections:
-            await connection.pool.disconnect()
+            await disconnect_database(connection)
+
+
+class ConnectionRegistry:
+    def __init__(self) -> None:
+        self.connections = {}
+        self.locks = {}
+
+    def get_lock(self, alias: str) -> asyncio.Lock:
+        loop = asyncio.get_event_loop()
+        lock, lock_loop = self.locks.get(alias, (None, None))
+        if lock is None or lock_loop is not loop:
+            lock = asyncio.Lock()
+            self.locks[alias] = (lock, loop)
+        return lock
+
+    async def create(self, alias: str) -> Connection:
+        databases = get_databases(get_settings())
+        try:
+            table_base = databases[alias]
+        except KeyError:
+            raise CraxDataBaseImproperlyConfigured(
+                "No database connection found. Check your configuration."
+            )
+        pool_options = {**POOL_OPTIONS, **table_base.get("pool", {})}
+        return await connect_database(
+            table_base,
+            pool_options,
+            health_check_interval=pool_options["health_check_interval"],
+            checked=time.monotonic(),
+            loop=asyncio.get_event_loop(),
+        )
+
+    async def check(self, connection: Connection) -> bool:
+        try:
+            for pool in connection.get_pools():
+                await pool.fetch_val("SELECT 1")
+        except DATABASE_ERRORS as ex:
+            logger.warning(
+                "Health check of database %s failed: %r", pool.url.database, ex
+            )
+            return False
+        connection.checked = time.monotonic()
+        return True
+
+    @staticmethod
+    def is_fresh(connection: Connection) -> bool:
+        interval = connection.health_check_interval
+        return interval is None or time.monotonic() - connection.checked < interval
+
+    async def get(self, alias: str) -> Connection:
+        connection = self.connections.get(alias)
+        if (
+            connection is not None
+            and connection.pool.is_connected
+            and connection.loop is asyncio.get_event_loop()
+            and self.is_fresh(connection)
+        ):
+            return connection
+        async with self.get_lock(alias):
+            connection = self.connections.get(alias)
+            if connection is not None:
+                if connection.loop is not asyncio.get_event_loop():
+                    # Pool of finished event loop can not be used or closed
+                    self.connections.pop(alias)
+                elif connection.pool.is_connected and (
+                    self.is_fresh(connection) or await self.check(connection)
+                ):
+                    return connection
+                else:
+                    await self.discard(alias)
+            connection = await self.create(alias)
+            self.connections[alias] = connection
+            return connection
+
+    async def discard(self, alias: str) -> None:
+        connection = self.connections.pop(alias, None)
+        if connection is not None:
+            try:
+                await disconnect_database(connection)
+            except DATABASE_ERRORS as ex:
+                logger.warning("Failed to close database %s: %r", alias, ex)
+
+    async def close(self) -> None:
+        for alias, connection in list(self.connections.items()):
+            if connection.loop is asyncio.get_event_loop():
+                await self.discard(alias)
+            else:
+                self.connections.pop(alias)
+
+
+connection_registry = ConnectionRegistry()
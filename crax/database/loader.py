@@ -0,0 +1,88 @@
+"""
+Batching loader of model rows. Calls of "load" made while handling one event
+loop iteration are coalesced in a single "WHERE key IN (...)" query per model,
+and loaded rows are memoized, so resolving relations row by row does not
+make N+1 queries. Loader should live not longer than request: use
+"get_loader(request)" to get the loader of current request.
+"""
+import asyncio
+import typing
+
+try:
+    from sqlalchemy import select
+except ImportError:  # pragma: no cover
+    raise
+
+from crax.data_types import Model, Request
+
+
+class DataLoader:
+    def __init__(self, max_batch_size: int = 500) -> None:
+        self.max_batch_size = max_batch_size
+        self.cache = {}
+        self.pending = {}
+        self.tasks = set()
+
+    def load(self, model: Model, pk: typing.Any, key: str = "id") -> asyncio.Future:
+        future = self.cache.get((model, key, pk))
+        if future is None:
+            loop = asyncio.get_event_loop()
+            future = loop.create_future()
+            self.cache[(model, key, pk)] = future
+            if not self.pending:
+                loop.call_soon(self.dispatch)
+            self.pending.setdefault((model, key), {})[pk] = future
+        return future
+
+    async def load_many(
+        self, model: Model, pks: typing.Iterable, key: str = "id"
+    ) -> typing.List[typing.Optional[typing.Mapping]]:
+        return list(await asyncio.gather(*[self.load(model, x, key) for x in pks]))
+
+    def dispatch(self) -> None:
+        pending, self.pending = self.pending, {}
+        for (model, key), batch in pending.items():
+            pks = list(batch)
+            for index in range(0, len(pks), self.max_batch_size):
+                chunk = {x: batch[x] for x in pks[index : index + self.max_batch_size]}
+                # Event loop keeps only weak references to tasks
+                task = asyncio.ensure_future(self.fetch(model, key, chunk))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+
+    async def fetch(
+        self, model: Model, key: str, batch: typing.Dict[typing.Any, asyncio.Future]
+    ) -> None:
+        try:
+            column = model.query.get_column(key)
+            query = select([model.table]).where(column.in_(list(batch)))
+            rows = await model.query.fetch_all(query=query)
+        except Exception as ex:
+            for pk, future in batch.items():
+                # Failed loads are not memoized, so they can be retried
+                self.cache.pop((model, key, pk), None)
+                if not future.done():
+                    future.set_exception(ex)
+            return
+        found = {x[key]: x for x in rows or []}
+        for pk, future in batch.items():
+            if not future.done():
+                future.set_result(found.get(pk))
+
+    def clear(self, model: Model = None, pk: typing.Any = None) -> None:
+        if model is None:
+            self.cache.clear()
+        else:
+            self.cache = {
+                k: v
+                for k, v in self.cache.items()
+                if k[0] is not model or (pk is not None and k[2] != pk)
+            }
+
+
+def get_loader(request: Request) -> DataLoader:
+    loader = getattr(request, "data_loader", None)
+    if loader is None:
+        loader = DataLoader()
+        request.data_loader = loader
+    return loader
@@ -3,25 +3,32 @@ Base classes for crax models and queries. Nothing more than very thin wrapper ar
 wellknown packages "SQLAlchemy Core Table" and "Databases" written by "Encode team".
 Thank you, guys, for your great job.
 """
+import functools
 import re
+import time
 from typing import Optional
 
 import typing
 
-from databases import Database
+from crax.database.connection import Connection, connection_registry
 
-from crax.database.connection import Connection
-
-from crax.data_types import Model, DBQuery, Selectable
+from crax.data_types import Model, Selectable
 from crax.exceptions import CraxDataBaseImproperlyConfigured
 
 try:
     from sqlalchemy import MetaData, Table, UniqueConstraint, Column, Integer, select, text, and_
+    from sqlalchemy.dialects.postgresql import pypostgresql
+    from sqlalchemy.sql import operators
+    from sqlalchemy.sql.dml import Insert
+    from sqlalchemy.sql.elements import BinaryExpression, BindParameter
 except ImportError:  # pragma: no cover
     raise
 
 from crax.utils import get_settings
 
+READ_METHODS = ["fetch_all", "fetch_one", "fetch_val"]
+MAX_PARAMETERS = {"sqlite": 999, "postgresql": 32767, "mysql": 65535}
+
 
 def to_snake_case(cls: Model) -> Optional[str]:
     if hasattr(cls, "__name__"):
@@ -38,104 +45,111 @@ def to_snake_case(cls: Model) -> Optional[str]:
         return table_name
 
 
+class QueryMethod:
+    # Method of "databases" connection bound to query. Name of method is not
+    # stored in query itself, so concurrent calls do not interfere.
+    __slots__ = ("query", "method")
+
+    def __init__(self, query: "Query", method: str) -> None:
+        self.query = query
+        self.method = method
+
+    async def __call__(
+        self, *args: Optional[tuple], **kwargs: typing.Mapping[str, typing.Any]
+    ) -> typing.Optional[typing.Any]:
+        return await self.query.call(self.method, **kwargs)
+
+
 class Query:
     def __init__(self, cls: Model) -> None:
-        self._method = None
         self.cls = cls
         self.driver = None
-
-    async def get_connection_pool(self):
+        self.methods = {}
+        self.statements = {}
+        self.on_write = []
+
+    async def notify_write(self, pks: typing.Optional[list] = None) -> None:
+        # Callbacks (e.g. cache invalidation) called after every write query
+        # with primary keys of changed rows, None if they are not known
+        for callback in self.on_write:
+            await callback(self.cls, pks)
+
+    def get_written_pks(self, query: typing.Any) -> typing.Optional[list]:
+        if isinstance(query, Insert):
+            return []
+        whereclause = getattr(query, "whereclause", None)
+        if whereclause is None:
+            whereclause = getattr(query, "_whereclause", None)
+        primary_key = list(self.cls.table.primary_key.columns)
+        if (
+            len(primary_key) == 1
+            and isinstance(whereclause, BinaryExpression)
+            and whereclause.left is primary_key[0]
+            and whereclause.operator is operators.eq
+            and isinstance(whereclause.right, BindParameter)
+        ):
+            return [whereclause.right.value]
+
+    async def get_connection_pool(self, read: bool = False) -> Connection:
         configuration = get_settings()
         connections = configuration.app.db_connections
-        main = True
         if not connections:
-            if not hasattr(configuration, "DATABASES"):
-                raise CraxDataBaseImproperlyConfigured(
-                    "Improperly configured project settings. "
-                    'Missed required parameter "DATABASES"'
-                )
-            databases = configuration.DATABASES
-            if not isinstance(databases, dict):
-                raise CraxDataBaseImproperlyConfigured(
-                    "Improperly configured project settings."
-                    " DATABASES parameter should be a dict"
-                )
-
-            elif "default" not in databases:
-                raise CraxDataBaseImproperlyConfigured(
-                    "Improperly configured project settings. "
-                    'DATABASES dictionary should contain "default" database'
-                )
-            try:
-                databases = configuration.DATABASES
-                table_base = databases[self.cls.database]
-                if table_base["driver"] != 'sqlite':
-                    port = table_base.get('port')
-                    if port:
-                        connection_string = (
-                            f'{table_base["driver"]}://{table_base["user"]}:'
-                            f'{table_base["password"]}@{table_base["host"]}:{port}/{table_base["name"]}'
-                        )
-                    else:
-                        connection_string = (
-                            f'{table_base["driver"]}://{table_base["user"]}:'
-                            f'{table_base["password"]}@{table_base["host"]}/{table_base["name"]}'
-                        )
-                else:
-                    connection_string = (
-                        f'{table_base["driver"]}://{table_base["name"]}'
-                    )
-                connection = Database(connection_string)
-                connection_pool = connection
-                self.driver = table_base["driver"]
-                main = False
-            except (KeyError, RuntimeError):
-                raise CraxDataBaseImproperlyConfigured(
-                    f"No database connection found. Check your configuration."
-                )
+            connection = await connection_registry.get(self.cls.database)
         else:
             try:
-                connection_pool = connections[self.cls.database].pool
-                self.driver = connections[self.cls.database].driver
+                connection = connections[self.cls.database]
             except (KeyError, RuntimeError):
                 raise CraxDataBaseImproperlyConfigured(
                     f"No database connection found. Check your configuration."
                 )
-        connection = Connection(
-            pool=connection_pool,
-            driver=self.driver,
-            main=main)
+        self.driver = connection.driver
+        if read is True:
+            connection = connection.get_replica()
         return connection
 
-    async def process_method(self, connection, **kwargs):
-        if hasattr(connection, self._method):
-            res = await getattr(connection, self._method)(**kwargs)
-        else:
-            raise AttributeError(
-                f"{self.cls.__name__} model has no method {self._method}"
-            )
+    async def fetch(
+        self, method: str, operation: str, primary: bool = False
+    ) -> typing.Any:
+        connection = await self.get_connection_pool(read=primary is False)
+        query = self.get_statement(operation, connection)
+        start = time.perf_counter()
+        res = await getattr(connection.pool, method)(query=query)
+        connection.record_latency(time.perf_counter() - start)
         return res
 
-    async def __call__(
-        self, *args: Optional[tuple], **kwargs: typing.Mapping[str, typing.Any]
-    ) -> typing.Optional[typing.Any]:
-
-        connection = await self.get_connection_pool()
-        if connection.main is False:
-            async with connection.pool as conn:
-                res = await self.process_method(conn, **kwargs)
+    async def process_method(self, connection, method: str, **kwargs):
+        if hasattr(connection, method):
+            res = await getattr(connection, method)(**kwargs)
         else:
-            res = await self.process_method(connection.pool, **kwargs)
-        return self.prepare_result(res)
+            raise AttributeError(f"{self.cls.__name__} model has no method {method}")
+        return res
 
-    def __getattr__(
+    async def call(
         self,
         method: str,
-        *args: Optional[tuple],
+        primary: bool = False,
         **kwargs: typing.Mapping[str, typing.Any],
-    ) -> DBQuery:
-        self._method = method
-        return self
+    ) -> typing.Optional[typing.Any]:
+        read = method in READ_METHODS and primary is False
+        connection = await self.get_connection_pool(read=read)
+        start = time.perf_counter()
+        res = await self.process_method(connection.pool, method, **kwargs)
+        connection.record_latency(time.perf_counter() - start)
+        if method not in READ_METHODS:
+            await self.notify_write(self.get_written_pks(kwargs.get("query")))
+        return self.prepare_result(res)
+
+    def __getattr__(self, method: str) -> QueryMethod:
+        if method.startswith("__") or method in [
+            "methods",
+            "statements",
+            "on_write",
+        ]:
+            raise AttributeError(method)
+        bound = self.methods.get(method)
+        if bound is None:
+            bound = self.methods[method] = QueryMethod(self, method)
+        return bound
 
     def prepare_result(self, result):
         res = result
@@ -153,83 +167,180 @@ class Query:
         return res
 
     def get_column(self, column_name: str) -> Optional[Column]:
-        columns = [x for x in self.cls.table.columns if x.name == column_name]
-        if columns:
-            column = columns[0]
-        else:
+        try:
+            return self.cls.column_map[column_name]
+        except KeyError:
             raise KeyError(
                 f'Model {self.cls.__name__} has no column named "{column_name}"'
             )
-        return column
 
-    def prepare_query(self) -> Selectable:
+    def prepare_query(self, operation: str = "all") -> Selectable:
         if self.cls.ordering is not None:
             column = self.get_column(self.cls.ordering)
-            assert callable(select)
-            query = select([self.cls.table]).order_by(column.asc())
+        elif operation == "last":
+            column = list(self.cls.table.primary_key)[0]
         else:
-            assert callable(select)
-            query = select([self.cls.table])
+            column = None
+        query = select([self.cls.table])
+        if column is not None and operation == "last":
+            query = query.order_by(column.desc())
+        elif column is not None:
+            query = query.order_by(column.asc())
+        if operation in ["first", "last"]:
+            query = query.limit(1)
         return query
 
-    async def all(self) -> typing.List[typing.Mapping]:
-        query = self.prepare_query()
-        connection = await self.get_connection_pool()
-        if connection.main is False:
-            async with connection.pool as conn:
-                res = await conn.fetch_all(query=query)
-        else:
-            res = await connection.pool.fetch_all(query=query)
+    def get_statement(self, operation: str, connection: Connection) -> Selectable:
+        # Select statements of model are compiled once per dialect and then
+        # sent as text with typed columns, so results are processed as before
+        dialect = getattr(getattr(connection.pool, "_backend", None), "_dialect", None)
+        key = (operation, self.cls.ordering, getattr(dialect, "name", None))
+        statement = self.statements.get(key)
+        if statement is None:
+            compiled = self.prepare_query(operation).compile(
+                dialect=dialect, compile_kwargs={"literal_binds": True}
+            )
+            statement = text(str(compiled)).columns(*self.cls.table.columns)
+            self.statements[key] = statement
+        return statement
+
+    async def all(
+        self, raw: bool = False, primary: bool = False
+    ) -> typing.List[typing.Mapping]:
+        res = await self.fetch("fetch_all", "all", primary=primary)
+        if raw is True:
+            return res
         return self.prepare_result(res)
 
-    async def first(self) -> typing.Optional[typing.Mapping]:
-        query = self.prepare_query()
-        connection = await self.get_connection_pool()
-        if connection.main is False:
-            async with connection.pool as conn:
-                res = await conn.fetch_one(query=query)
-        else:
-            res = await connection.pool.fetch_one(query=query)
+    async def first(
+        self, raw: bool = False, primary: bool = False
+    ) -> typing.Optional[typing.Mapping]:
+        res = await self.fetch("fetch_one", "first", primary=primary)
+        if raw is True:
+            return res
         return self.prepare_result(res)
 
-    async def last(self) -> typing.Optional[typing.Mapping]:
-        constraints = list(self.cls.table.primary_key)
-        if self.cls.ordering is not None:
-            column = self.get_column(self.cls.ordering)
-        else:
-            column = list(constraints)[0]
-        assert callable(select)
-        query = select([self.cls.table]).order_by(column.desc())
-        connection = await self.get_connection_pool()
-        if connection.main is False:
-            async with connection.pool as conn:
-                res = await conn.fetch_one(query=query)
-        else:
-            res = await connection.pool.fetch_one(query=query)
+    async def last(
+        self, raw: bool = False, primary: bool = False
+    ) -> typing.Optional[typing.Mapping]:
+        res = await self.fetch("fetch_one", "last", primary=primary)
+        if raw is True:
+            return res
         return self.prepare_result(res)
 
+    async def iterate(
+        self,
+        query: Selectable = None,
+        values: dict = None,
+        raw: bool = False,
+        primary: bool = False,
+    ) -> typing.AsyncGenerator[typing.Mapping, None]:
+        connection = await self.get_connection_pool(read=primary is False)
+        if query is None:
+            query = self.get_statement("all", connection)
+        async for row in connection.pool.iterate(query=query, values=values):
+            yield row if raw is True else self.prepare_result(row)
+
+    async def chunks(
+        self,
+        chunk_size: int = 1000,
+        query: Selectable = None,
+        values: dict = None,
+        raw: bool = False,
+    ) -> typing.AsyncGenerator[typing.List[typing.Mapping], None]:
+        # Chunk size only groups iterated rows. Number of rows fetched from
+        # cursor at once is set by driver ("databases" has no option for it)
+        batch = []
+        async for row in self.iterate(query=query, values=values, raw=raw):
+            batch.append(row)
+            if len(batch) >= chunk_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
     async def insert(self, **kwargs: Optional[dict]) -> None:
         query = self.cls.table.insert()
         connection = await self.get_connection_pool()
-        if connection.main is False:
-            async with connection.pool as conn:
-                await conn.execute(query=query, values=kwargs["values"])
-        else:
-            await connection.pool.execute(query=query, values=kwargs["values"])
+        await connection.pool.execute(query=query, values=kwargs["values"])
+        await self.notify_write([])
+
+    def split_rows(
+        self, rows: typing.List[dict], chunk_size: int
+    ) -> typing.Generator[typing.List[dict], None, None]:
+        # Rows of one multi-row VALUES statement should have the same keys and
+        # number of parameters (columns with defaults are rendered as well)
+        # should not exceed driver limit
+        limit = MAX_PARAMETERS.get(self.driver, 32767)
+        chunk_size = max(1, min(chunk_size, limit // len(self.cls.table.columns)))
+        chunk = []
+        for row in rows:
+            if chunk and (len(chunk) >= chunk_size or row.keys() != chunk[0].keys()):
+                yield chunk
+                chunk = []
+            chunk.append(row)
+        if chunk:
+            yield chunk
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def get_copy_dialect() -> typing.Any:
+        # The same dialect "databases" package uses for asyncpg, so values are
+        # processed the same way as values of other queries
+        return pypostgresql.dialect(paramstyle="pyformat")
+
+    async def copy_rows(self, connection: Connection, rows: typing.List[dict]) -> int:
+        # All rows should have the same keys: missed columns get server defaults
+        dialect = self.get_copy_dialect()
+        columns = [x for x in self.cls.table.columns if x.name in rows[0]]
+        processors = [x.type.bind_processor(dialect) for x in columns]
+        records = [
+            tuple(
+                processor(row[column.name]) if processor else row[column.name]
+                for column, processor in zip(columns, processors)
+            )
+            for row in rows
+        ]
+        async with connection.pool.connection() as conn:
+            result = await conn.raw_connection.copy_records_to_table(
+                self.cls.table.name,
+                records=records,
+                columns=[x.name for x in columns],
+                schema_name=self.cls.table.schema,
+            )
+        return int(result.split()[-1])
 
     async def bulk_insert(
-        self, **kwargs: Optional[typing.List[Optional[dict]]]
-    ) -> None:
+        self,
+        chunk_size: int = 1000,
+        method: str = None,
+        **kwargs: Optional[typing.List[Optional[dict]]],
+    ) -> int:
+        rows = list(kwargs["values"])
+        if not rows:
+            return 0
         connection = await self.get_connection_pool()
-        if connection.main is False:
-            async with connection.pool as conn:
-                await conn.execute_many(
-                    query=self.cls.table.insert(), values=kwargs["values"]
+        if method is None:
+            method = "values"
+        if method not in ["copy", "values", "many"]:
+            raise ValueError(f'Unknown bulk insert method "{method}"')
+        count = 0
+        async with connection.pool.transaction():
+            if method == "many":
+                await connection.pool.execute_many(
+                    query=self.cls.table.insert(), values=rows
                 )
-        else:
-            await connection.pool.execute_many(
-                query=self.cls.table.insert(), values=kwargs["values"]
-            )
+                count = len(rows)
+            elif method == "copy":
+                for chunk in self.split_rows(rows, chunk_size):
+                    count += await self.copy_rows(connection, chunk)
+            else:
+                for chunk in self.split_rows(rows, chunk_size):
+                    query = self.cls.table.insert().values(chunk)
+                    await connection.pool.execute(query=query)
+                    count += len(chunk)
+        await self.notify_write([])
+        return count
 
 
 class CraxTableMeta(type):
@@ -310,6 +421,7 @@ class CraxTableMeta(type):
             new_column = cls.create_column(column_dict, table)
             table.append_column(new_column)
         cls.table = table
+        cls.column_map = {x.name: x for x in table.columns}
         super(CraxTableMeta, cls).__init__(name, bases, attrs)
 
     def create_name(cls, attrs) -> typing.Union[str, typing.Callable]:
@@ -326,15 +438,15 @@ class CraxTableMeta(type):
         return object.__getattribute__(self, item)
 
     def __getattr__(self, method: str, *args: Optional[tuple]) -> typing.Callable:
-        self._method = method
-        return self._compile
+        return functools.partial(self._compile, method)
 
-    def _compile(self, *args: Optional[tuple]) -> Optional[typing.Callable]:
-        if hasattr(self.table, self._method):
-            method = getattr(self.table, self._method)
-            return method(*args)
+    def _compile(
+        self, method: str, *args: Optional[tuple]
+    ) -> Optional[typing.Callable]:
+        if hasattr(self.table, method):
+            return getattr(self.table, method)(*args)
         else:
-            raise AttributeError(f"{self.__name__} has no attribute {self._method}")
+            raise AttributeError(f"{self.__name__} has no attribute {method}")
 
     @staticmethod
     def create_column(column_dict, table):
@@ -5,60 +5,161 @@ Response should be used ResponseMiddleware. The difference is that the
 first ones will be processed BEFORE application will launched. If any
 errors will raised during middleware processing application process
 will not be continued. ResponseMiddleware modifies headers and body
-AFTER request processed.
+AFTER request processed. Middleware listed in project settings is imported
+and sorted once, when application starts, by MiddlewareChain.
 """
 import asyncio
 from abc import ABC, abstractmethod
 
 import typing
+from crax.exceptions import CraxImproperlyConfigured
+from crax.data_types import Send
 from crax.request import Request
 from crax.response_types import StreamingResponse
 
 
+class MiddlewareResponse(StreamingResponse):
+    # Messages of wrapped application are sent as they are, unless middleware
+    # replaced body iterator. So files sent with "pathsend" and "zerocopy"
+    # extensions are read into body only if middleware rewrites the body
+    chunk_size = 65536
+
+    def __init__(
+        self,
+        request: Request,
+        messages: typing.AsyncIterator,
+        status_code: int,
+        task: asyncio.Task,
+    ) -> None:
+        self.messages = messages
+        self.task = task
+        self.body_stream = self.read_body()
+        super(MiddlewareResponse, self).__init__(
+            request, content=self.body_stream, status_code=status_code
+        )
+
+    async def close(self) -> None:
+        # Application waits until its file messages are processed, so it is
+        # cancelled (and its files are closed) if response was not sent
+        if not self.task.done():
+            self.task.cancel()
+            await asyncio.wait([self.task])
+
+    async def read_file(self, message: dict) -> typing.AsyncGenerator[bytes, None]:
+        loop = asyncio.get_event_loop()
+        if message["type"] == "http.response.pathsend":
+            file = await loop.run_in_executor(None, open, message["path"], "rb")
+        else:
+            file = message["file"]
+            if "offset" in message:
+                await loop.run_in_executor(None, file.seek, message["offset"])
+        remaining = message.get("count")
+        try:
+            while remaining is None or remaining > 0:
+                size = self.chunk_size
+                if remaining is not None:
+                    size = min(size, remaining)
+                    remaining -= size
+                chunk = await loop.run_in_executor(None, file.read, size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            if message["type"] == "http.response.pathsend":
+                await loop.run_in_executor(None, file.close)
+
+    async def read_body(self) -> typing.AsyncGenerator[bytes, None]:
+        async for message in self.messages:
+            if message["type"] in ResponseMiddleware.file_extensions:
+                async for chunk in self.read_file(message):
+                    yield chunk
+            else:
+                yield message.get("body", b"")
+
+    async def stream_response(self, send: Send) -> None:
+        if self.body_iterator is not self.body_stream:
+            await super(MiddlewareResponse, self).stream_response(send)
+            return
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.headers,
+            }
+        )
+        async for message in self.messages:
+            await send(message)
+
+
 class ResponseMiddleware(ABC):
     # Thanks to Starlette for the idea of ​​implementing the Response Middleware call stack.
+    file_extensions = ["http.response.pathsend", "http.response.zerocopy"]
 
     def __init__(self, app) -> None:
         self.app = app
         self.request = app.request
+        self.settings = self.request.settings
         self.headers = []
 
     async def __call__(self, scope, receive, send) -> None:
         self.receive = receive
-        response = await self.process_headers()
-        await response(scope, receive, send)
+        self.downstream = None
+        try:
+            response = await self.process_headers()
+            await response(scope, receive, send)
+        finally:
+            if self.downstream is not None:
+                await self.downstream.close()
 
     async def call_next(self, request: Request):
         loop = asyncio.get_event_loop()
         queue = asyncio.Queue()
-        scope = request.scope
         receive = self.receive
-        send = queue.put
+
+        async def send(message: dict) -> None:
+            # File can be closed by application as soon as message is sent,
+            # so application waits until file message is processed
+            sent = None
+            if message["type"] in self.file_extensions:
+                sent = asyncio.Event()
+            await queue.put((message, sent))
+            if sent is not None:
+                await sent.wait()
 
         async def task() -> None:
             try:
-                await self.app(scope, receive, send)
+                await self.app(request.scope, receive, send)
             finally:
                 await queue.put(None)
 
         _task = loop.create_task(task())
-        message = await queue.get()
-        if message is None:
+        item = await queue.get()
+        if item is None:
             _task.result()
             raise RuntimeError("No response returned.")
+        message = item[0]
 
-        async def body_stream() -> typing.AsyncGenerator[bytes, None]:
-            while True:
-                m = await queue.get()
-                if m is None:
-                    break
-                yield m["body"]
+        async def messages() -> typing.AsyncGenerator[dict, None]:
+            sent = None
+            try:
+                while True:
+                    item = await queue.get()
+                    if item is None:
+                        break
+                    message, sent = item
+                    yield message
+                    if sent is not None:
+                        sent.set()
+            finally:
+                if sent is not None:
+                    sent.set()
             _task.result()
 
-        response = StreamingResponse(
-            self.request, status_code=message["status"], content=body_stream()
+        response = MiddlewareResponse(
+            self.request, messages(), status_code=message["status"], task=_task
         )
         response.headers = message["headers"]
+        self.downstream = response
         return response
 
     @abstractmethod
@@ -70,8 +171,63 @@ class ResponseMiddleware(ABC):
 class RequestMiddleware(ABC):
     def __init__(self, request: Request) -> None:
         self.request = request
+        self.settings = request.settings
         self.headers = self.request.response_headers
 
     @abstractmethod
     async def process_headers(self) -> typing.Any:  # pragma: no cover
         pass
+
+
+class MiddlewareChain:
+    def __init__(self, middleware: typing.Optional[typing.List[str]]) -> None:
+        self.request_middleware = []
+        self.response_middleware = []
+        self.error = None
+        if middleware:
+            try:
+                for path in middleware:
+                    self.add(self.import_middleware(path))
+            except (ImportError, AttributeError, CraxImproperlyConfigured) as ex:
+                self.request_middleware = []
+                self.response_middleware = []
+                self.error = ex
+
+    @staticmethod
+    def import_middleware(path: str) -> type:
+        spl_middleware = path.split(".")
+        module = __import__(".".join(spl_middleware[:-1]), fromlist=spl_middleware[:-1])
+        return getattr(module, spl_middleware[-1])
+
+    def add(self, middleware: type) -> None:
+        if isinstance(middleware, type) and issubclass(middleware, RequestMiddleware):
+            self.request_middleware.append(middleware)
+        elif isinstance(middleware, type) and issubclass(
+            middleware, ResponseMiddleware
+        ):
+            self.response_middleware.append(middleware)
+        else:
+            raise CraxImproperlyConfigured(
+                f"{middleware} should be subclass of RequestMiddleware"
+                f" or ResponseMiddleware"
+            )
+
+    async def process_request(
+        self, request: Request
+    ) -> typing.Tuple[Request, typing.Optional[typing.Any]]:
+        errors = None
+        for middleware in self.request_middleware:
+            processed = await middleware(request=request).process_headers()
+            try:
+                request, errors = processed
+            except TypeError:
+                if isinstance(processed, Request):
+                    request = processed
+                else:
+                    errors = processed
+        return request, errors
+
+    def wrap(self, app: typing.Any) -> typing.Any:
+        for middleware in self.response_middleware:
+            app = middleware(app=app)
+        return app
@@ -0,0 +1,186 @@
+"""
+Response compression middleware. Compresses response body with gzip, brotli
+or zstandard (if packages installed) depending on Accept-Encoding request
+header. Bodies of known length up to "max_buffer" are compressed at once,
+others are compressed on the fly and streaming responses have every chunk
+flushed to the client. Options should be defined in project settings as
+"COMPRESSION_OPTIONS" dictionary: "types", "min_size", "max_buffer",
+"encodings" and "level" (number or dictionary with level per encoding).
+"""
+import typing
+import zlib
+
+from crax.middleware.base import ResponseMiddleware
+from crax.response_types import FileResponse
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DEFAULT_TYPES = [
+    "text/",
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+]
+DEFAULT_LEVELS = {"br": 4, "zstd": 3, "gzip": 6}
+
+
+class GzipCompressor:
+    def __init__(self, level: int) -> None:
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self.compressor.compress(chunk)
+
+    def flush(self) -> bytes:
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self.compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliCompressor:
+    def __init__(self, level: int) -> None:
+        self.compressor = brotli.Compressor(quality=level)
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self.compressor.process(chunk)
+
+    def flush(self) -> bytes:
+        return self.compressor.flush()
+
+    def finish(self) -> bytes:
+        return self.compressor.finish()
+
+
+class ZstdCompressor:
+    def __init__(self, level: int) -> None:
+        self.compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self.compressor.compress(chunk)
+
+    def flush(self) -> bytes:
+        return self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+def get_compressors() -> typing.Dict[str, type]:
+    compressors = {}
+    if brotli is not None:
+        compressors["br"] = BrotliCompressor
+    if zstandard is not None:
+        compressors["zstd"] = ZstdCompressor
+    compressors["gzip"] = GzipCompressor
+    return compressors
+
+
+class CompressionMiddleware(ResponseMiddleware):
+    def __init__(self, **kwargs: typing.Any) -> None:
+        super(CompressionMiddleware, self).__init__(**kwargs)
+        options = self.settings.get("COMPRESSION_OPTIONS", {})
+        self.types = options.get("types", DEFAULT_TYPES)
+        self.min_size = options.get("min_size", 500)
+        self.max_buffer = options.get("max_buffer", 1048576)
+        self.compressors = get_compressors()
+        encodings = options.get("encodings", list(self.compressors))
+        self.encodings = [x for x in encodings if x in self.compressors]
+        level = options.get("level")
+        if isinstance(level, dict):
+            self.levels = {**DEFAULT_LEVELS, **level}
+        elif level is not None:
+            self.levels = {x: level for x in DEFAULT_LEVELS}
+        else:
+            self.levels = DEFAULT_LEVELS
+
+    def check_type(self, content_type: typing.Optional[bytes]) -> bool:
+        if not content_type:
+            return False
+        content_type = content_type.decode("latin-1").split(";")[0].strip().lower()
+        return any(
+            content_type.startswith(x) if x.endswith("/") else content_type == x
+            for x in self.types
+        )
+
+    def get_encoding(self) -> typing.Optional[str]:
+        accept_encoding = self.request.headers.get("accept-encoding")
+        if not accept_encoding or not self.encodings:
+            return None
+        accepted = FileResponse.parse_accept_encoding(accept_encoding.encode("latin-1"))
+        quality, _, encoding = max(
+            (accepted.get(x, accepted.get("*", 0)), -index, x)
+            for index, x in enumerate(self.encodings)
+        )
+        if quality > 0:
+            return encoding
+
+    @staticmethod
+    async def single_chunk(body: bytes) -> typing.AsyncGenerator[bytes, None]:
+        yield body
+
+    @staticmethod
+    async def compress_stream(
+        chunks: typing.AsyncIterator, compressor: typing.Any, flush: bool = True
+    ) -> typing.AsyncGenerator[bytes, None]:
+        async for chunk in chunks:
+            if chunk:
+                compressed = compressor.compress(chunk)
+                if flush is True:
+                    compressed += compressor.flush()
+                if compressed:
+                    yield compressed
+        yield compressor.finish()
+
+    async def process_headers(self) -> typing.Any:
+        response = await super(CompressionMiddleware, self).process_headers()
+        headers = {k.lower(): v for k, v in response.headers}
+        if (
+            self.request.method == "HEAD"
+            or response.status_code < 200
+            or response.status_code in [204, 206, 304]
+            or b"content-encoding" in headers
+            or b"no-transform" in headers.get(b"cache-control", b"")
+            or not self.check_type(headers.get(b"content-type"))
+        ):
+            return response
+        if b"accept-encoding" not in headers.get(b"vary", b"").lower():
+            response.headers.append((b"Vary", b"Accept-Encoding"))
+        content_length = headers.get(b"content-length")
+        if content_length is not None and int(content_length) < self.min_size:
+            return response
+        encoding = self.get_encoding()
+        if encoding is None:
+            return response
+
+        compressor = self.compressors[encoding](self.levels[encoding])
+        response.headers = [
+            x
+            for x in response.headers
+            if x[0].lower() not in [b"content-length", b"etag"]
+        ]
+        if b"etag" in headers:
+            etag = headers[b"etag"] + b"-" + encoding.encode("latin-1")
+            response.headers.append((b"etag", etag))
+        response.headers.append((b"content-encoding", encoding.encode("latin-1")))
+        if content_length is not None and int(content_length) <= self.max_buffer:
+            body = b"".join([x async for x in response.body_iterator])
+            body = compressor.compress(body) + compressor.finish()
+            response.headers.append(
+                (b"content-length", str(len(body)).encode("latin-1"))
+            )
+            response.body_iterator = self.single_chunk(body)
+        else:
+            response.body_iterator = self.compress_stream(
+                response.body_iterator, compressor, flush=content_length is None
+            )
+        return response
@@ -10,7 +10,6 @@ import typing
 from crax.response_types import TextResponse
 
 from crax.middleware.base import ResponseMiddleware
-from crax.utils import get_settings_variable
 
 
 class CorsHeadersMiddleware(ResponseMiddleware):
@@ -33,7 +32,7 @@ class CorsHeadersMiddleware(ResponseMiddleware):
 
     async def process_headers(self) -> typing.Any:
         response = await super(CorsHeadersMiddleware, self).process_headers()
-        cors_options = get_settings_variable("CORS_OPTIONS", default={})
+        cors_options = self.settings.get("CORS_OPTIONS", {})
         preflight = True
         error = None
         status_code = 200
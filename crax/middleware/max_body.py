@@ -7,14 +7,13 @@ import typing
 
 from crax.data_types import ExceptionType
 from crax.middleware.base import RequestMiddleware
-from crax.utils import get_settings_variable
 
 from crax.data_types import Request
 
 
 class MaxBodySizeMiddleware(RequestMiddleware):
     async def process_headers(self) -> typing.Union[Request, ExceptionType]:
-        max_body = get_settings_variable("MAX_BODY_SIZE", default=1024 * 1024)
+        max_body = self.settings.get("MAX_BODY_SIZE", 1024 * 1024)
         content_length = self.request.headers.get("content-length")
         if content_length and int(content_length) > int(max_body):
             self.request.status_code = 400
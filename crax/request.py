@@ -7,10 +7,17 @@ from http.cookies import SimpleCookie
 from urllib import parse
 import typing
 
+from crax.utils import Settings, get_settings_snapshot
+
 
 class Request:
-    def __init__(self, scope: typing.MutableMapping[str, typing.Any]) -> None:
+    def __init__(
+        self, scope: typing.MutableMapping[str, typing.Any], settings: Settings = None
+    ) -> None:
         self.scope = scope
+        if settings is None:
+            settings = get_settings_snapshot()
+        self.settings = settings
         self.params = {}
         self.query = {}
         self.data = None
@@ -12,7 +12,6 @@ import re
 import typing
 from base64 import b64decode
 
-import itsdangerous
 from itsdangerous import BadTimeSignature, BadSignature, SignatureExpired
 
 from crax.data_types import Request, Scope, Receive, Send
@@ -25,39 +24,52 @@ from crax.exceptions import (
     CraxImproperlyConfigured,
     CraxUnauthorized)
 from crax.response_types import FileResponse, TextResponse
-from crax.utils import get_error_handler, get_settings_variable, unpack_urls
+from crax.signing import get_signer
+from crax.urls import Router
+from crax.utils import Settings, get_error_handler, get_settings_snapshot
+from crax.static import StaticFiles
 from crax.views import DefaultCrax, DefaultError
 
 
 class Response:
     available_methods = []
 
-    def __init__(self, request: Request, debug: bool = False) -> None:
+    def __init__(
+        self,
+        request: Request,
+        debug: bool = False,
+        router: Router = None,
+        settings: Settings = None,
+        static_files: StaticFiles = None,
+    ) -> None:
         self.debug = debug
         self.request = request
-        self.url_patterns = get_settings_variable("URL_PATTERNS")
-        self.enable_csrf = get_settings_variable("ENABLE_CSRF")
-        self.error_handlers = get_settings_variable("ERROR_HANDLERS")
-        self.static_dirs = get_settings_variable("STATIC_DIRS", default=["static"])
-        self.base_url = get_settings_variable(
-            "BASE_URL",
-            default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        if settings is None:
+            settings = get_settings_snapshot()
+        self.settings = settings
+        self.url_patterns = settings.get("URL_PATTERNS")
+        if router is None:
+            router = Router(self.url_patterns)
+        self.router = router
+        self.enable_csrf = settings.get("ENABLE_CSRF")
+        self.error_handlers = settings.get("ERROR_HANDLERS")
+        self.static_dirs = list(settings.get("STATIC_DIRS", ["static"]))
+        self.static_chunk_size = settings.get("STATIC_CHUNK_SIZE")
+        self.base_url = settings.get(
+            "BASE_URL", os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         )
+        if static_files is None:
+            static_files = StaticFiles(base_url=self.base_url, index=False)
+        self.static_files = static_files
         self.headers = {}
         self.status = 200
         self.errors = None
 
     def resolve_path(self) -> typing.Optional[typing.Callable]:
-        handler = None
-        url_list = list(unpack_urls(self.url_patterns))
-        if not url_list:
+        if not self.router:
             handler = DefaultCrax
         else:
-            for url in url_list:
-                handler = url.get_match(self.request)
-                if handler is not None:
-                    handler = url.get_match(self.request)
-                    break
+            handler = self.router.resolve(self.request)
             if handler is None:
                 if self.request.scheme in ["http", "http.request"]:
                     if self.debug is True:
@@ -104,6 +116,21 @@ class Response:
                         "error_message": self.request.path,
                         "status_code": 403,
                     }
+
+        if getattr(handler, "permissions_required", None):
+            # Without authentication middleware user is unknown
+            if not getattr(self.request.user, "is_authenticated", False):
+                errors = {
+                    "error_handler": CraxUnauthorized,
+                    "error_message": self.request.path,
+                    "status_code": 401,
+                }
+            elif not self.request.user.has_permissions(handler.permissions_required):
+                errors = {
+                    "error_handler": CraxForbidden,
+                    "error_message": self.request.path,
+                    "status_code": 403,
+                }
         if hasattr(handler, "methods") and self.request.scheme in [
             "http",
             "http.request",
@@ -123,17 +150,14 @@ class Response:
                             "status_code": 403,
                         }
                     else:
-                        secret_key = get_settings_variable("SECRET_KEY")
-                        if secret_key is None:
+                        signer = get_signer(self.settings)
+                        if signer is None:
                             raise CraxImproperlyConfigured(
                                 '"SECRET_KEY" string should be defined in settings to use CSRF Protection'
                             )
                         try:
                             token = self.request.post["csrf_token"]
-                            signer = itsdangerous.TimestampSigner(str(secret_key))
-                            max_age = get_settings_variable(
-                                "SESSION_EXPIRES", default=1209600
-                            )
+                            max_age = self.settings.get("SESSION_EXPIRES", 1209600)
                             session_cookie = b64decode(token)
                             signer.unsign(session_cookie, max_age=max_age)
                         except (
@@ -161,8 +185,8 @@ class Response:
                     "status_code": 500,
                 }
             else:
-                handler.methods += ["HEAD", "OPTIONS"]
-                if self.request.method not in handler.methods:
+                methods = list(handler.methods) + ["HEAD", "OPTIONS"]
+                if self.request.method not in methods:
                     errors = {
                         "error_handler": CraxMethodNotAllowed,
                         "error_message": handler,
@@ -170,7 +194,19 @@ class Response:
                     }
         return errors
 
-    def dispatch(self) -> typing.Callable:
+    async def load_permissions(self, handler: typing.Callable) -> None:
+        user = self.request.user
+        if (
+            getattr(handler, "permissions_required", None)
+            and getattr(user, "is_authenticated", False)
+            and not user.is_superuser
+            and user.permissions is None
+        ):
+            from crax.auth.permissions import get_permissions
+
+            user.permissions = await get_permissions(user.pk, settings=self.settings)
+
+    async def dispatch(self) -> typing.Callable:
         if not self.request.path.endswith("/"):
             self.static_dirs += ["swagger/static/"]
             detect_static = [
@@ -180,28 +216,18 @@ class Response:
         else:
             detect_static = None
         if detect_static:
-            try:
-                crax_path = __import__(FileResponse.__module__)
-                path = f"{crax_path.__path__[0]}{self.request.path}"
-                os.stat(path)
-                response = FileResponse(path)
-            except FileNotFoundError:
-                try:
-                    os.stat(self.request.path)
-                    response = FileResponse(self.request.path)
-                except FileNotFoundError:
-                    try:
-                        os.stat(self.request.path[1:])
-                        response = FileResponse(self.request.path[1:])
-                    except FileNotFoundError:
-                        try:
-                            path = self.base_url + self.request.path
-                            os.stat(path)
-                            response = FileResponse(path)
-                        except FileNotFoundError as e:
-                            response = TextResponse(self.request, b"File not found", status_code=404)
+            asset = await self.static_files.get(self.request.path)
+            if asset is not None:
+                response = FileResponse(
+                    asset.path, chunk_size=self.static_chunk_size, asset=asset
+                )
+            else:
+                response = TextResponse(
+                    self.request, b"File not found", status_code=404
+                )
         else:
             resolver = self.resolve_path()
+            await self.load_permissions(resolver)
             error = self.check_allowed(resolver)
             if not error:
                 response = resolver
@@ -222,7 +248,7 @@ class Response:
         return response
 
     async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
-        response = self.dispatch()
+        response = await self.dispatch()
         if response:
             if inspect.iscoroutinefunction(response):
                 await response(self.request, scope, receive, send)
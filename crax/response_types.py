@@ -5,13 +5,15 @@ compatible view
 import asyncio
 import hashlib
 import http.cookies
-import json
 import os
 import typing
+import uuid
+from contextlib import asynccontextmanager
 from email.utils import formatdate, parsedate
 from mimetypes import guess_type
 
 from crax.data_types import Request, Scope, Receive, Send
+from crax.serializers import get_serializer
 
 import aiofiles
 from aiofiles.os import stat as aio_stat
@@ -117,39 +119,84 @@ class JSONResponse(BaseResponse):
     content_type = "application/json"
 
     def render(self, content: typing.Any) -> bytes:
-        return json.dumps(
-            content,
-            ensure_ascii=False,
-            allow_nan=False,
-            indent=None,
-            separators=(",", ":"),
-        ).encode("utf-8")
+        settings = getattr(self.request, "settings", None)
+        serializer = settings.get("JSON_SERIALIZER") if settings is not None else None
+        return get_serializer(serializer)(content)
+
+
+class MemoryFile:
+    def __init__(self, content: bytes) -> None:
+        self.content = content
+        self.position = 0
+
+    async def __aenter__(self) -> "MemoryFile":
+        return self
+
+    async def __aexit__(self, *args: typing.Any) -> None:
+        pass
+
+    async def seek(self, offset: int) -> None:
+        self.position = offset
+
+    async def read(self, size: int = -1) -> bytes:
+        if size < 0:
+            size = len(self.content) - self.position
+        chunk = self.content[self.position : self.position + size]
+        self.position += len(chunk)
+        return chunk
 
 
 class FileResponse(BaseResponse):
-    chunk_size = 4096
+    chunk_size = 65536
+    precompressed = {"br": ".br", "gzip": ".gz"}
 
     def __init__(
-        self, path: str, status_code: int = 200, static_res: os.stat_result = None,
+        self,
+        path: str,
+        status_code: int = 200,
+        static_res: os.stat_result = None,
+        chunk_size: int = None,
+        asset: typing.Any = None,
     ) -> None:
         super(FileResponse, self).__init__()
         self.path = path
         self.status_code = status_code
         self.headers = []
         self.static_res = static_res
-        if static_res:
+        self.file_content = None
+        self.sidecars = None
+        if chunk_size:
+            self.chunk_size = chunk_size
+        if asset is not None:
+            self.static_res = asset.stat_result
+            self.content_type = asset.content_type
+            self.headers = list(asset.headers)
+            self.file_content = asset.content
+            self.sidecars = {x[0]: x[1:] for x in asset.sidecars}
+        elif static_res:
             self.static_headers(static_res)
 
-    def static_headers(self, stat_result: os.stat_result) -> None:
+    @staticmethod
+    def create_static_headers(
+        path: str, stat_result: os.stat_result
+    ) -> typing.Tuple[str, list]:
         content_length = str(stat_result.st_size)
         last_modified = formatdate(stat_result.st_mtime, usegmt=True)
         etag_base = str(stat_result.st_mtime) + "-" + str(stat_result.st_size)
         etag = hashlib.md5(etag_base.encode()).hexdigest()
-        self.content_type = guess_type(self.path)[0] or "text/plain"
-        self.headers.append((b"content-type", self.content_type.encode("latin-1")))
-        self.headers.append((b"content-length", content_length.encode("latin-1")))
-        self.headers.append((b"last-modified", last_modified.encode("latin-1")))
-        self.headers.append((b"etag", etag.encode("latin-1")))
+        content_type = guess_type(path)[0] or "text/plain"
+        headers = [
+            (b"content-type", content_type.encode("latin-1")),
+            (b"content-length", content_length.encode("latin-1")),
+            (b"last-modified", last_modified.encode("latin-1")),
+            (b"etag", etag.encode("latin-1")),
+            (b"accept-ranges", b"bytes"),
+        ]
+        return content_type, headers
+
+    def static_headers(self, stat_result: os.stat_result) -> None:
+        self.content_type, headers = self.create_static_headers(self.path, stat_result)
+        self.headers += headers
 
     @staticmethod
     def check_modified(request_headers: dict, response_headers: dict) -> bool:
@@ -164,45 +211,296 @@ class FileResponse(BaseResponse):
                 return True
         return False
 
-    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
-        if not self.static_res:
-            static_res = await aio_stat(self.path)
-            self.static_headers(static_res)
-            if self.check_modified(dict(scope["headers"]), dict(self.headers)):
-                available_keys = [
-                    "cache-control",
-                    "content-location",
-                    "date",
-                    "etag",
-                    "expires",
-                    "vary",
-                ]
-                headers = [x for x in self.headers if x[0].decode() in available_keys]
-                await send(
-                    {"type": "http.response.start", "status": 304, "headers": headers}
-                )
-                await send({"type": "http.response.body", "body": b""})
+    @staticmethod
+    def parse_accept_encoding(accept_encoding: bytes) -> dict:
+        encodings = {}
+        for item in accept_encoding.decode("latin-1").split(","):
+            name, _, params = item.partition(";")
+            quality = 1.0
+            params = params.strip()
+            if params.startswith("q="):
+                try:
+                    quality = float(params[2:])
+                except ValueError:
+                    quality = 0.0
+            if name.strip():
+                encodings[name.strip().lower()] = quality
+        return encodings
+
+    async def find_sidecars(self) -> dict:
+        if self.sidecars is None:
+            self.sidecars = {}
+            for encoding, suffix in self.precompressed.items():
+                try:
+                    stat_result = await aio_stat(self.path + suffix)
+                    self.sidecars[encoding] = (self.path + suffix, stat_result)
+                except (FileNotFoundError, NotADirectoryError):
+                    pass
+        return self.sidecars
+
+    async def negotiate_encoding(self, request_headers: dict) -> None:
+        sidecars = {
+            k: v
+            for k, v in (await self.find_sidecars()).items()
+            if v[1].st_mtime >= self.static_res.st_mtime
+        }
+        if not sidecars:
+            return
+        self.headers.append((b"vary", b"accept-encoding"))
+        if b"range" in request_headers or b"accept-encoding" not in request_headers:
+            return
+        accepted = self.parse_accept_encoding(request_headers[b"accept-encoding"])
+        quality, _, encoding = max(
+            (accepted.get(x, accepted.get("*", 0)), -index, x)
+            for index, x in enumerate(self.precompressed)
+            if x in sidecars
+        )
+        if quality <= 0:
+            return
+        self.path, self.static_res = sidecars[encoding]
+        self.file_content = None
+        etag = dict(self.headers)[b"etag"] + b"-" + encoding.encode("latin-1")
+        content_length = str(self.static_res.st_size).encode("latin-1")
+        self.headers = [
+            x for x in self.headers if x[0] not in [b"content-length", b"etag"]
+        ]
+        self.headers.append((b"content-length", content_length))
+        self.headers.append((b"etag", etag))
+        self.headers.append((b"content-encoding", encoding.encode("latin-1")))
+
+    @staticmethod
+    def check_if_range(request_headers: dict, response_headers: dict) -> bool:
+        if b"if-range" not in request_headers:
+            return True
+        if_range = request_headers[b"if-range"].decode("latin-1").strip()
+        if if_range.startswith("W/"):
+            return False
+        if if_range.strip('"') == response_headers[b"etag"].decode("latin-1"):
+            return True
+        if_range_date = parsedate(if_range)
+        last_modified = parsedate(response_headers[b"last-modified"].decode("utf-8"))
+        return if_range_date is not None and if_range_date == last_modified
+
+    @staticmethod
+    def parse_range(
+        range_header: typing.Optional[bytes], size: int
+    ) -> typing.Optional[typing.List[typing.Tuple[int, int]]]:
+        # Returns None if header should be ignored, empty list if
+        # no range can be satisfied, otherwise sorted and merged ranges
+        if not range_header:
+            return None
+        unit, _, specs = range_header.decode("latin-1").partition("=")
+        if unit.strip().lower() != "bytes" or not specs.strip():
+            return None
+        ranges = []
+        for spec in specs.split(","):
+            start, sep, end = spec.strip().partition("-")
+            if not sep:
+                return None
+            try:
+                if not start:
+                    suffix = int(end)
+                    if suffix > 0 and size > 0:
+                        ranges.append((max(size - suffix, 0), size - 1))
+                    continue
+                start = int(start)
+                end = int(end) if end else None
+            except ValueError:
+                return None
+            if end is None:
+                end = size - 1
+            elif start > end:
+                return None
+            if start < size:
+                ranges.append((start, min(end, size - 1)))
+        merged = []
+        for start, end in sorted(ranges):
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
             else:
+                merged.append((start, end))
+        return merged
+
+    async def read_range(
+        self, file: typing.Any, start: int, end: int
+    ) -> typing.AsyncGenerator:
+        await file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await file.read(min(self.chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+    def partial_headers(self, content_length: int) -> list:
+        headers = [
+            x for x in self.headers if x[0] not in [b"content-length", b"content-type"]
+        ]
+        headers.append((b"content-length", str(content_length).encode("latin-1")))
+        return headers
+
+    async def send_not_satisfiable(self, send: Send) -> None:
+        headers = self.partial_headers(0)
+        content_range = f"bytes */{self.static_res.st_size}"
+        headers.append((b"content-range", content_range.encode("latin-1")))
+        await send({"type": "http.response.start", "status": 416, "headers": headers})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def send_range(self, scope: Scope, send: Send, start: int, end: int) -> None:
+        headers = self.partial_headers(end - start + 1)
+        content_range = f"bytes {start}-{end}/{self.static_res.st_size}"
+        headers.append((b"content-type", self.content_type.encode("latin-1")))
+        headers.append((b"content-range", content_range.encode("latin-1")))
+        await send({"type": "http.response.start", "status": 206, "headers": headers})
+        extensions = scope.get("extensions") or {}
+        if self.file_content is None and "http.response.zerocopy" in extensions:
+            async with self.open_raw_file() as file:
                 await send(
                     {
-                        "type": "http.response.start",
-                        "status": self.status_code,
-                        "headers": self.headers,
+                        "type": "http.response.zerocopy",
+                        "file": file,
+                        "offset": start,
+                        "count": end - start + 1,
+                        "more_body": False,
                     }
                 )
-                async with aiofiles.open(self.path, mode="rb") as file:
-                    _continue = True
-                    while _continue:
-                        chunk = await file.read(self.chunk_size)
-                        if len(chunk) != self.chunk_size:
-                            _continue = False
-                        await send(
-                            {
-                                "type": "http.response.body",
-                                "body": chunk,
-                                "more_body": _continue,
-                            }
-                        )
+        else:
+            async with self.open_file() as file:
+                async for chunk in self.read_range(file, start, end):
+                    await send(
+                        {"type": "http.response.body", "body": chunk, "more_body": True}
+                    )
+            await send({"type": "http.response.body", "body": b""})
+
+    async def send_ranges(
+        self, send: Send, ranges: typing.List[typing.Tuple[int, int]]
+    ) -> None:
+        boundary = uuid.uuid4().hex
+        size = self.static_res.st_size
+        parts = [
+            (
+                f"--{boundary}\r\n"
+                f"Content-Type: {self.content_type}\r\n"
+                f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+            ).encode("latin-1")
+            for start, end in ranges
+        ]
+        closing = f"\r\n--{boundary}--\r\n".encode("latin-1")
+        content_length = (
+            sum(len(x) for x in parts)
+            + sum(end - start + 1 for start, end in ranges)
+            + 2 * (len(ranges) - 1)
+            + len(closing)
+        )
+        headers = self.partial_headers(content_length)
+        content_type = f"multipart/byteranges; boundary={boundary}"
+        headers.append((b"content-type", content_type.encode("latin-1")))
+        await send({"type": "http.response.start", "status": 206, "headers": headers})
+        async with self.open_file() as file:
+            for index, (start, end) in enumerate(ranges):
+                part = parts[index]
+                if index:
+                    part = b"\r\n" + part
+                await send(
+                    {"type": "http.response.body", "body": part, "more_body": True}
+                )
+                async for chunk in self.read_range(file, start, end):
+                    await send(
+                        {"type": "http.response.body", "body": chunk, "more_body": True}
+                    )
+        await send({"type": "http.response.body", "body": closing})
+
+    def open_file(self) -> typing.Any:
+        if self.file_content is not None:
+            return MemoryFile(self.file_content)
+        return aiofiles.open(self.path, mode="rb")
+
+    @asynccontextmanager
+    async def open_raw_file(self) -> typing.AsyncGenerator[typing.BinaryIO, None]:
+        # Zerocopy extension needs file object with descriptor, so file is
+        # opened and closed in executor the same way aiofiles does
+        loop = asyncio.get_event_loop()
+        file = await loop.run_in_executor(None, open, self.path, "rb")
+        try:
+            yield file
+        finally:
+            await loop.run_in_executor(None, file.close)
+
+    async def send_file(self, scope: Scope, send: Send) -> None:
+        extensions = scope.get("extensions") or {}
+        if self.file_content is not None:
+            await send({"type": "http.response.body", "body": self.file_content})
+        elif "http.response.pathsend" in extensions:
+            await send(
+                {
+                    "type": "http.response.pathsend",
+                    "path": os.path.abspath(self.path),
+                }
+            )
+        elif "http.response.zerocopy" in extensions:
+            async with self.open_raw_file() as file:
+                await send(
+                    {"type": "http.response.zerocopy", "file": file, "more_body": False}
+                )
+        else:
+            async with aiofiles.open(self.path, mode="rb") as file:
+                _continue = True
+                while _continue:
+                    chunk = await file.read(self.chunk_size)
+                    if len(chunk) != self.chunk_size:
+                        _continue = False
+                    await send(
+                        {
+                            "type": "http.response.body",
+                            "body": chunk,
+                            "more_body": _continue,
+                        }
+                    )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if not self.static_res:
+            self.static_res = await aio_stat(self.path)
+            self.static_headers(self.static_res)
+        request_headers = dict(scope["headers"])
+        await self.negotiate_encoding(request_headers)
+        response_headers = dict(self.headers)
+        ranges = None
+        if self.status_code == 200 and self.check_if_range(
+            request_headers, response_headers
+        ):
+            ranges = self.parse_range(
+                request_headers.get(b"range"), self.static_res.st_size
+            )
+        if self.check_modified(request_headers, response_headers):
+            available_keys = [
+                "cache-control",
+                "content-location",
+                "date",
+                "etag",
+                "expires",
+                "vary",
+            ]
+            headers = [x for x in self.headers if x[0].decode() in available_keys]
+            await send(
+                {"type": "http.response.start", "status": 304, "headers": headers}
+            )
+            await send({"type": "http.response.body", "body": b""})
+        elif ranges is None:
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": self.status_code,
+                    "headers": self.headers,
+                }
+            )
+            await self.send_file(scope, send)
+        elif not ranges:
+            await self.send_not_satisfiable(send)
+        elif len(ranges) == 1:
+            await self.send_range(scope, send, *ranges[0])
+        else:
+            await self.send_ranges(send, ranges)
 
 
 class StreamingResponse:
@@ -249,3 +547,55 @@ class StreamingResponse:
             (self.stream_response, {"send": send}),
             (self.listen_for_disconnect, {"receive": receive}),
         )
+
+
+class StreamingJSONResponse(StreamingResponse):
+    # Encodes items of (async) iterable one by one and sends them as JSON array,
+    # so large result sets are never kept in memory as a whole
+    content_type = "application/json"
+
+    def __init__(
+        self,
+        request,
+        content: typing.Union[typing.AsyncIterable, typing.Iterable],
+        status_code: int = 200,
+        chunk_size: int = 65536,
+    ) -> None:
+        self.chunk_size = chunk_size
+        settings = getattr(request, "settings", None)
+        serializer = settings.get("JSON_SERIALIZER") if settings is not None else None
+        self.serializer = get_serializer(serializer)
+        super(StreamingJSONResponse, self).__init__(
+            request,
+            self.encode(content),
+            status_code=status_code,
+            media_type=self.content_type,
+        )
+        if b"content-type" not in [x[0] for x in self.headers]:
+            content_type = f"{self.content_type}; charset=utf-8"
+            self.headers.append((b"content-type", content_type.encode("latin-1")))
+
+    @staticmethod
+    async def iterate(
+        content: typing.Union[typing.AsyncIterable, typing.Iterable]
+    ) -> typing.AsyncGenerator:
+        if hasattr(content, "__aiter__"):
+            async for item in content:
+                yield item
+        else:
+            for item in content:
+                yield item
+
+    async def encode(
+        self, content: typing.Union[typing.AsyncIterable, typing.Iterable]
+    ) -> typing.AsyncGenerator[bytes, None]:
+        buffer = bytearray(b"[")
+        separator = b""
+        async for item in self.iterate(content):
+            buffer += separator + self.serializer(item)
+            separator = b","
+            if len(buffer) >= self.chunk_size:
+                yield bytes(buffer)
+                buffer.clear()
+        buffer += b"]"
+        yield bytes(buffer)
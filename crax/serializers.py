@@ -0,0 +1,103 @@
+"""
+JSON serializers used by JSON responses. By default the fastest installed
+library is used: orjson, msgspec, ujson and then standard library json.
+Serializer can be set in project settings with "JSON_SERIALIZER" variable
+as one of names above or dotted path to a callable that returns bytes.
+Dates, decimals, UUIDs and database rows are serialized without converting
+data before.
+"""
+import datetime
+import decimal
+import json
+import typing
+import uuid
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+from crax.exceptions import CraxImproperlyConfigured
+
+
+def default(obj: typing.Any) -> typing.Any:
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    elif isinstance(obj, (decimal.Decimal, uuid.UUID)):
+        return str(obj)
+    elif hasattr(obj, "keys") and hasattr(obj, "__getitem__"):
+        return {key: obj[key] for key in obj.keys()}
+    elif isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    raise TypeError(f"Object of type {obj.__class__.__name__} is not JSON serializable")
+
+
+def json_dumps(obj: typing.Any) -> bytes:
+    return json.dumps(
+        obj,
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+        default=default,
+    ).encode("utf-8")
+
+
+def orjson_dumps(obj: typing.Any) -> bytes:
+    return orjson.dumps(obj, default=default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def ujson_dumps(obj: typing.Any) -> bytes:
+    return ujson.dumps(
+        obj, ensure_ascii=False, escape_forward_slashes=False, default=default
+    ).encode("utf-8")
+
+
+SERIALIZERS = ["orjson", "msgspec", "ujson", "json"]
+
+
+def create_serializer(name: str) -> typing.Optional[typing.Callable]:
+    if name == "orjson" and orjson is not None:
+        return orjson_dumps
+    elif name == "msgspec" and msgspec is not None:
+        return msgspec.json.Encoder(enc_hook=default).encode
+    elif name == "ujson" and ujson is not None:
+        return ujson_dumps
+    elif name == "json":
+        return json_dumps
+
+
+_serializers = {}
+
+
+def get_serializer(name: str = None) -> typing.Callable[[typing.Any], bytes]:
+    serializer = _serializers.get(name)
+    if serializer is not None:
+        return serializer
+    if name is None:
+        serializer = next(
+            x for x in (create_serializer(x) for x in SERIALIZERS) if x is not None
+        )
+    elif name in SERIALIZERS:
+        serializer = create_serializer(name)
+        if serializer is None:
+            raise CraxImproperlyConfigured(f'JSON serializer "{name}" is not installed')
+    else:
+        spl_path = name.split(".")
+        try:
+            module = __import__(".".join(spl_path[:-1]), fromlist=spl_path[:-1])
+            serializer = getattr(module, spl_path[-1])
+        except (ImportError, AttributeError, ValueError):
+            raise CraxImproperlyConfigured(f'Unknown JSON serializer "{name}"')
+    _serializers[name] = serializer
+    return serializer
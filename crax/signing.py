@@ -0,0 +1,69 @@
+"""
+Signing of session cookies and CSRF tokens. Signers are created once for
+secret key and reused by all requests with the same settings, keys are
+derived once when signer is created (not on every sign and unsign call).
+Secret keys can be rotated: old secrets listed in "SECRET_KEY_FALLBACKS"
+project settings variable are still accepted when values are verified, new
+values are always signed with "SECRET_KEY".
+"""
+import typing
+
+import itsdangerous
+from itsdangerous import BadSignature, SignatureExpired
+
+from crax.utils import Settings, get_settings_snapshot
+
+
+class CachedKeySigner(itsdangerous.TimestampSigner):
+    def __init__(self, *args: typing.Any, **kwargs: typing.Any) -> None:
+        super(CachedKeySigner, self).__init__(*args, **kwargs)
+        self.key = super(CachedKeySigner, self).derive_key()
+
+    def derive_key(self, *args: typing.Any) -> bytes:
+        return self.key
+
+
+class SigningService:
+    def __init__(self, secret: str, old_secrets: typing.Iterable[str] = ()) -> None:
+        self.signer = CachedKeySigner(str(secret))
+        self.old_signers = [CachedKeySigner(str(x)) for x in old_secrets]
+
+    def sign(self, value: typing.Union[str, bytes]) -> bytes:
+        return self.signer.sign(value)
+
+    def unsign(self, value: bytes, max_age: int = None) -> bytes:
+        try:
+            return self.signer.unsign(value, max_age=max_age)
+        except SignatureExpired:
+            raise
+        except BadSignature as ex:
+            for signer in self.old_signers:
+                try:
+                    return signer.unsign(value, max_age=max_age)
+                except SignatureExpired:
+                    raise
+                except BadSignature:
+                    pass
+            raise ex
+
+
+_signers = {}
+_settings_signers = {}
+
+
+def get_signer(settings: Settings = None) -> typing.Optional[SigningService]:
+    if settings is None:
+        settings = get_settings_snapshot()
+    cached = _settings_signers.get(settings.module)
+    if cached is not None and cached[0] is settings:
+        return cached[1]
+    secret = settings.get("SECRET_KEY")
+    signer = None
+    if secret is not None:
+        old_secrets = tuple(settings.get("SECRET_KEY_FALLBACKS", ()))
+        signer = _signers.get((secret, old_secrets))
+        if signer is None:
+            signer = SigningService(secret, old_secrets)
+            _signers[(secret, old_secrets)] = signer
+    _settings_signers[settings.module] = (settings, signer)
+    return signer
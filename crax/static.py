@@ -0,0 +1,242 @@
+"""
+Registry of static files. Static directories are indexed once at startup,
+so static requests are served without blocking stat calls and response
+headers are not computed per request. Small files can be kept in memory.
+In debug mode modification time of requested files is checked to pick up
+changes. Otherwise files are expected not to change while application runs:
+indexed headers (Content-Length, ETag, Last-Modified) and contents kept in
+memory are not refreshed. Precompressed ".br" and ".gz" copies of files are
+served to clients that accept them and are not served as files themselves.
+Files are read and missed paths are looked up in executor, so event loop is
+not blocked.
+"""
+import asyncio
+import gzip
+import io
+import os
+import stat
+import typing
+from collections import OrderedDict
+
+from aiofiles.os import stat as aio_stat
+
+from crax.response_types import FileResponse
+from crax.utils import Settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = [
+    "application/javascript",
+    "application/json",
+    "application/xml",
+    "image/svg+xml",
+]
+
+
+def gzip_compress(content: bytes) -> bytes:
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode="wb", compresslevel=9, mtime=0) as file:
+        file.write(content)
+    return buffer.getvalue()
+
+
+class StaticAsset(typing.NamedTuple):
+    path: str
+    stat_result: os.stat_result
+    content_type: str
+    headers: tuple
+    content: typing.Optional[bytes] = None
+    sidecars: tuple = ()
+
+
+class StaticFiles:
+    def __init__(
+        self,
+        static_dirs: typing.List[str] = None,
+        base_url: str = None,
+        debug: bool = False,
+        memory_budget: int = 0,
+        memory_file_size: int = 65536,
+        index: bool = True,
+    ) -> None:
+        self.static_dirs = list(static_dirs or [])
+        self.base_url = base_url
+        self.debug = debug
+        self.memory_budget = memory_budget
+        self.memory_file_size = memory_file_size
+        self.memory = OrderedDict()
+        self.memory_size = 0
+        self.package_dir = os.path.dirname(os.path.abspath(__file__))
+        self.assets = {}
+        if index is True:
+            self.index()
+
+    @classmethod
+    def from_settings(cls, settings: Settings, debug: bool = False) -> "StaticFiles":
+        return cls(
+            static_dirs=settings.get("STATIC_DIRS", ["static"]),
+            base_url=settings.get(
+                "BASE_URL", os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            ),
+            debug=debug,
+            memory_budget=settings.get("STATIC_MEMORY_BUDGET", 0),
+            memory_file_size=settings.get("STATIC_MEMORY_FILE_SIZE", 65536),
+        )
+
+    def __len__(self) -> int:
+        return len(self.assets)
+
+    def candidates(self, path: str) -> typing.List[str]:
+        candidates = [f"{self.package_dir}{path}", path, path[1:]]
+        if self.base_url is not None:
+            candidates.append(self.base_url + path)
+        return candidates
+
+    def index(self) -> None:
+        # Lookup order for requested path is the package directory, current
+        # directory and then BASE_URL, so they are indexed in reverse order
+        roots = []
+        if self.base_url is not None:
+            roots += [(self.base_url, x) for x in self.static_dirs]
+        roots += [(".", x) for x in self.static_dirs]
+        roots.append((self.package_dir, "swagger/static"))
+        suffixes = tuple(FileResponse.precompressed.values())
+        for root, static_dir in roots:
+            directory = os.path.join(root, static_dir)
+            for dir_path, _, file_names in os.walk(directory):
+                for file_name in file_names:
+                    if file_name.endswith(suffixes) and (
+                        os.path.splitext(file_name)[0] in file_names
+                    ):
+                        continue
+                    file_path = os.path.join(dir_path, file_name)
+                    url = "/" + os.path.relpath(file_path, root).replace(os.sep, "/")
+                    asset = self.create_asset(file_path)
+                    if asset is not None:
+                        self.assets[url] = asset
+
+    @staticmethod
+    def is_sidecar(path: str) -> bool:
+        for suffix in FileResponse.precompressed.values():
+            if path.endswith(suffix) and os.path.isfile(path[: -len(suffix)]):
+                return True
+        return False
+
+    @classmethod
+    def create_asset(cls, path: str) -> typing.Optional[StaticAsset]:
+        try:
+            stat_result = os.stat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        if not stat.S_ISREG(stat_result.st_mode) or cls.is_sidecar(path):
+            return None
+        content_type, headers = FileResponse.create_static_headers(path, stat_result)
+        sidecars = []
+        for encoding, suffix in FileResponse.precompressed.items():
+            try:
+                sidecars.append((encoding, path + suffix, os.stat(path + suffix)))
+            except (FileNotFoundError, NotADirectoryError):
+                pass
+        return StaticAsset(
+            path, stat_result, content_type, tuple(headers), sidecars=tuple(sidecars)
+        )
+
+    async def find(self, path: str) -> typing.Optional[StaticAsset]:
+        loop = asyncio.get_event_loop()
+        for candidate in self.candidates(path):
+            asset = await loop.run_in_executor(None, self.create_asset, candidate)
+            if asset is not None:
+                self.assets[path] = asset
+                return asset
+
+    async def refresh(
+        self, path: str, asset: StaticAsset
+    ) -> typing.Optional[StaticAsset]:
+        try:
+            stat_result = await aio_stat(asset.path)
+            if (
+                stat_result.st_mtime == asset.stat_result.st_mtime
+                and stat_result.st_size == asset.stat_result.st_size
+            ):
+                return asset
+        except (FileNotFoundError, NotADirectoryError):
+            pass
+        self.assets.pop(path, None)
+        self.forget(asset.path)
+        return await self.find(path)
+
+    def forget(self, path: str) -> None:
+        content = self.memory.pop(path, None)
+        if content is not None:
+            self.memory_size -= len(content)
+
+    @staticmethod
+    def read(path: str) -> bytes:
+        with open(path, "rb") as file:
+            return file.read()
+
+    async def load_content(self, asset: StaticAsset) -> StaticAsset:
+        content = self.memory.get(asset.path)
+        if content is not None:
+            self.memory.move_to_end(asset.path)
+        else:
+            size = asset.stat_result.st_size
+            if size > self.memory_file_size or size > self.memory_budget:
+                return asset
+            loop = asyncio.get_event_loop()
+            content = await loop.run_in_executor(None, self.read, asset.path)
+            if len(content) != size:
+                return asset
+            # Concurrent request could load the same file while it was read
+            self.forget(asset.path)
+            self.memory[asset.path] = content
+            self.memory_size += len(content)
+            while self.memory_size > self.memory_budget:
+                _, evicted = self.memory.popitem(last=False)
+                self.memory_size -= len(evicted)
+        return asset._replace(content=content)
+
+    def compress(self, min_size: int = 256, force: bool = False) -> typing.List[str]:
+        created = []
+        suffixes = tuple(FileResponse.precompressed.values())
+        for asset in {x.path: x for x in self.assets.values()}.values():
+            compressible = (
+                asset.content_type.startswith("text/")
+                or asset.content_type in COMPRESSIBLE_TYPES
+                or asset.path.endswith(".map")
+            )
+            if (
+                not compressible
+                or asset.path.endswith(suffixes)
+                or asset.stat_result.st_size < min_size
+            ):
+                continue
+            content = self.read(asset.path)
+            compressors = [(".gz", gzip_compress)]
+            if brotli is not None:
+                compressors.append((".br", brotli.compress))
+            for suffix, compressor in compressors:
+                path = asset.path + suffix
+                if force is not True and os.path.isfile(path):
+                    if os.stat(path).st_mtime >= asset.stat_result.st_mtime:
+                        continue
+                compressed = compressor(content)
+                if len(compressed) >= len(content):
+                    continue
+                with open(path, "wb") as file:
+                    file.write(compressed)
+                created.append(path)
+        return created
+
+    async def get(self, path: str) -> typing.Optional[StaticAsset]:
+        asset = self.assets.get(path)
+        if asset is None:
+            asset = await self.find(path)
+        elif self.debug is True:
+            asset = await self.refresh(path, asset)
+        if asset is not None and self.memory_budget:
+            asset = await self.load_content(asset)
+        return asset
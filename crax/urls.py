@@ -8,8 +8,11 @@ import typing
 
 from crax.data_types import Request
 from crax.exceptions import CraxImproperlyConfigured, CraxPathNotFound
+from crax.utils import unpack_urls
 from crax.views import DefaultError
 
+PARAM_PATTERN = re.compile("<([a-zA-Z0-9_:]+)>")
+
 
 def include(module: str) -> Optional[list]:
     try:
@@ -96,6 +99,24 @@ class Route:
                 params = dict(zip(names, values))
         return matched, params
 
+    def process_match(
+        self, url: Url, request: Request, params: dict
+    ) -> typing.Callable:
+        handler = self.handler
+        request.params = params
+        if url.masquerade is True:
+            if hasattr(handler, "scope"):
+                masqueraded = [
+                    x for x in handler.scope if x == request.path.split("/")[-1]
+                ]
+                if not masqueraded:
+                    handler = DefaultError(request, CraxPathNotFound(request.path))
+                else:
+                    handler.template = masqueraded[0]
+            else:
+                handler = DefaultError(request, CraxPathNotFound(request.path))
+        return handler
+
     def get_match(self, request: Request) -> Optional[typing.Callable]:
         scheme = request.scheme
         handler = None
@@ -112,28 +133,177 @@ class Route:
                 else:
                     matched, params = self.check_len(url, path)
                 if matched is True and scheme in url.scheme:
-                    handler = self.handler
-                    request.params = params
-                    if url.masquerade is True:
-                        if hasattr(handler, "scope"):
-                            masqueraded = [
-                                x
-                                for x in handler.scope
-                                if x == request.path.split("/")[-1]
-                            ]
-                            if not masqueraded:
-                                handler = DefaultError(
-                                    request, CraxPathNotFound(request.path)
-                                )
-                            else:
-                                handler.template = masqueraded[0]
-                        else:
-                            handler = DefaultError(
-                                request, CraxPathNotFound(request.path)
-                            )
+                    handler = self.process_match(url, request, params)
             else:
                 handler = DefaultError(
                     request,
                     CraxImproperlyConfigured(f'{url} should be instance of "Url"'),
                 )
         return handler
+
+
+class CompiledUrl(typing.NamedTuple):
+    order: tuple
+    route: Route
+    url: Url
+    find_path: str
+    segments: frozenset = frozenset()
+    statics: frozenset = frozenset()
+    names: tuple = ()
+
+
+class Router:
+    """
+    All Routes from URL_PATTERNS compiled once on application start. Paths
+    are split, regular expressions and parameter names are prepared here, so
+    request resolving is only a few dict lookups for each path segment.
+    Matching rules are exactly the same as Route.get_match has. Url is
+    indexed by the number of segments and by the rarest of its static
+    segments, since all of static segments should be found in request path.
+    If several urls match the same path, first declared Route wins (and the
+    last matching url inside of it). Entry of Route that is not a Url matches
+    any path, so resolving fails when such Route is reached.
+    """
+
+    def __init__(self, url_patterns: typing.Any) -> None:
+        self.exact = {}
+        self.masquerade = {}
+        self.segments = {}
+        self.regex_urls = []
+        self.wrong_url = None
+        self.length = 0
+        compiled_urls = []
+        if url_patterns:
+            for route_index, route in enumerate(unpack_urls(url_patterns)):
+                for url_index, url in enumerate(route.urls):
+                    self.length += 1
+                    order = (route_index, -url_index)
+                    if isinstance(url, Url):
+                        compiled_urls.append(self.compile(route, url, order))
+                    elif self.wrong_url is None or order < self.wrong_url[0]:
+                        self.wrong_url = (order, url)
+        self.index(compiled_urls)
+
+    def __len__(self) -> int:
+        return self.length
+
+    @staticmethod
+    def compile(route: Route, url: Url, order: tuple) -> CompiledUrl:
+        find_path = route.create_path(url, "")[0]
+        split_path = [x for x in find_path.split("/") if x]
+        names = tuple(
+            "".join(re.split(PARAM_PATTERN, x)).split(":")[0]
+            for x in split_path
+            if re.match(PARAM_PATTERN, x)
+        )
+        return CompiledUrl(
+            order=order,
+            route=route,
+            url=url,
+            find_path=find_path,
+            segments=frozenset(split_path),
+            statics=frozenset(x for x in split_path if "<" not in x),
+            names=names,
+        )
+
+    def index(self, compiled_urls: typing.List[CompiledUrl]) -> None:
+        frequency = {}
+        for compiled in compiled_urls:
+            for segment in compiled.statics:
+                frequency[segment] = frequency.get(segment, 0) + 1
+
+        for compiled in compiled_urls:
+            url = compiled.url
+            if url.type_ == "re_path":
+                self.regex_urls.append((re.compile(compiled.find_path), compiled))
+                continue
+            self.exact.setdefault((url.masquerade, compiled.find_path), []).append(
+                compiled
+            )
+            split_path = tuple(x for x in compiled.find_path.split("/") if x)
+            if url.masquerade is True:
+                self.masquerade.setdefault(split_path, []).append(compiled)
+                continue
+            if compiled.statics:
+                keys = [min(compiled.statics, key=lambda x: (frequency[x], x))]
+            else:
+                keys = compiled.segments
+            for segment in keys:
+                self.segments.setdefault((len(split_path), segment), []).append(
+                    compiled
+                )
+
+    @staticmethod
+    def check_segments(
+        compiled: CompiledUrl, split_req_path: list
+    ) -> typing.Optional[dict]:
+        intersection = compiled.segments.intersection(split_req_path)
+        if compiled.url.namespace:
+            namespace_len = len(compiled.url.namespace.split("."))
+            matched = len(intersection) == namespace_len + 1
+        else:
+            matched = len(intersection) > 0
+        if matched and compiled.statics.issubset(split_req_path):
+            values = [x for x in split_req_path if x not in intersection]
+            return dict(zip(compiled.names, values))
+
+    def find(
+        self, request: Request
+    ) -> typing.Optional[typing.Tuple[CompiledUrl, dict]]:
+        scheme = request.scheme
+        path = request.path
+        if not path.endswith("/"):
+            slashed_path = path + "/"
+        else:
+            slashed_path = path
+        split_req_path = [x for x in path.split("/") if x]
+        found = None
+        params = {}
+
+        candidates = self.exact.get((False, slashed_path), []) + self.exact.get(
+            (True, path), []
+        )
+        if split_req_path:
+            candidates += self.masquerade.get(tuple(split_req_path[:-1]), [])
+        for compiled in candidates:
+            if scheme in compiled.url.scheme:
+                if found is None or compiled.order < found.order:
+                    found = compiled
+
+        depth = len(split_req_path)
+        for segment in set(split_req_path):
+            for compiled in self.segments.get((depth, segment), []):
+                if scheme not in compiled.url.scheme:
+                    continue
+                if found is not None and found.order < compiled.order:
+                    continue
+                if (
+                    compiled.url.masquerade is False
+                    and compiled.find_path == slashed_path
+                ):
+                    continue
+                compiled_params = self.check_segments(compiled, split_req_path)
+                if compiled_params is not None:
+                    found, params = compiled, compiled_params
+
+        for pattern, compiled in self.regex_urls:
+            if found is not None and found.order < compiled.order:
+                continue
+            match = pattern.match(compiled.route.create_path(compiled.url, path)[1])
+            if match and scheme in compiled.url.scheme:
+                found, params = compiled, match.groupdict()
+        if found is not None:
+            return found, params
+
+    def resolve(self, request: Request) -> Optional[typing.Callable]:
+        match = self.find(request)
+        if self.wrong_url is not None:
+            order, url = self.wrong_url
+            if match is None or order < match[0].order:
+                return DefaultError(
+                    request,
+                    CraxImproperlyConfigured(f'{url} should be instance of "Url"'),
+                )
+        if match is not None:
+            compiled, params = match
+            return compiled.route.process_match(compiled.url, request, params)
@@ -2,6 +2,8 @@
 System helpers.
 """
 import os
+from dataclasses import dataclass
+from types import MappingProxyType
 
 import typing
 from crax.response_types import TextResponse
@@ -17,29 +19,66 @@ def get_settings(settings: str = None) -> typing.Any:
         raise ex.__class__(ex) from ex
 
 
-def get_settings_variable(variable: str, default=None) -> typing.Any:
-    settings = get_settings()
-    if hasattr(settings, variable):
-        return getattr(settings, variable)
-    return default
+@dataclass(frozen=True)
+class Settings:
+    """
+    Frozen snapshot of project settings module. Module variables are copied
+    once, so reading of settings is a dict lookup instead of module import.
+    """
 
+    module: str
+    variables: typing.Mapping[str, typing.Any]
 
-async def collect_middleware(based: str) -> typing.Any:
-    middleware = get_settings_variable("MIDDLEWARE")
-    middleware_list = []
-    if middleware:
-        for m in middleware:
-            spl_middleware = m.split(".")
-            try:
-                module = __import__(
-                    ".".join(spl_middleware[:-1]), fromlist=spl_middleware[:-1]
-                )
-                middle = getattr(module, spl_middleware[-1])
-                if based in [x.__name__ for x in middle.__bases__]:
-                    middleware_list.append(middle)
-            except (ImportError, AttributeError, ModuleNotFoundError) as ex:
-                return ex
-    return middleware_list
+    @classmethod
+    def from_module(cls, settings: str = None) -> "Settings":
+        module = get_settings(settings)
+        return cls(
+            module=module.__name__, variables=MappingProxyType(dict(vars(module)))
+        )
+
+    def get(self, variable: str, default: typing.Any = None) -> typing.Any:
+        return self.variables.get(variable, default)
+
+    def __contains__(self, variable: str) -> bool:
+        return variable in self.variables
+
+    def __getattr__(self, variable: str) -> typing.Any:
+        if not variable.startswith("_") and variable in self.variables:
+            return self.variables[variable]
+        raise AttributeError(f'Settings "{self.module}" have no variable "{variable}"')
+
+
+_settings_snapshots = {}
+
+
+def get_settings_snapshot(settings: str = None) -> Settings:
+    if settings is None:
+        settings = os.environ.get("CRAX_SETTINGS", "crax.conf")
+    try:
+        return _settings_snapshots[settings]
+    except KeyError:
+        snapshot = Settings.from_module(settings)
+        spec = getattr(get_settings(settings), "__spec__", None)
+        if getattr(spec, "_initializing", False) is False:
+            # Settings module that is still being imported (e.g. it creates
+            # Crax application itself) should not be frozen half-done.
+            _settings_snapshots[settings] = snapshot
+        return snapshot
+
+
+def reload_settings(settings: str = None) -> Settings:
+    if settings is None:
+        settings = os.environ.get("CRAX_SETTINGS", "crax.conf")
+    _settings_snapshots.pop(settings, None)
+    return get_settings_snapshot(settings)
+
+
+def get_settings_variable(
+    variable: str, default=None, settings: Settings = None
+) -> typing.Any:
+    if settings is None:
+        settings = get_settings_snapshot()
+    return settings.get(variable, default)
 
 
 def unpack_urls(nest: typing.Any) -> typing.Generator:
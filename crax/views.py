@@ -11,16 +11,24 @@ import traceback
 import typing
 from base64 import b64encode
 
-import itsdangerous
-
 from crax.data_types import ExceptionType, Request, Scope, Receive, Send
 from crax.exceptions import CraxNoTemplateGiven, CraxImproperlyConfigured
-from crax.response_types import JSONResponse, TextResponse
-from crax.utils import get_settings_variable, unpack_urls
+from crax.response_types import JSONResponse, StreamingJSONResponse, TextResponse
+from crax.signing import get_signer
+from crax.utils import (
+    Settings,
+    get_settings_snapshot,
+    get_settings_variable,
+    unpack_urls,
+)
 from jinja2 import (
+    BytecodeCache,
+    ChoiceLoader,
     Environment,
     PackageLoader,
+    FileSystemBytecodeCache,
     FileSystemLoader,
+    ModuleLoader,
     TemplateNotFound,
     Template,
 )
@@ -83,24 +91,131 @@ def url(*args: typing.Union[tuple, list], **kwargs: typing.Any) -> typing.Option
 
 
 def csrf_token():
-    secret_key = get_settings_variable("SECRET_KEY")
-    if secret_key is None:
+    signer = get_signer()
+    if signer is None:
         raise CraxImproperlyConfigured(
             '"SECRET_KEY" string should be defined in settings to use CSRF Protection'
         )
-
-    signer = itsdangerous.TimestampSigner(str(secret_key))
     sign = signer.sign(str(int(time.time())))
     encoded = b64encode(sign)
     csrf_key = encoded.decode("utf-8")
     return csrf_key
 
 
+class MemoryBytecodeCache(BytecodeCache):
+    def __init__(self) -> None:
+        self.storage = {}
+
+    def load_bytecode(self, bucket: typing.Any) -> None:
+        code = self.storage.get(bucket.key)
+        if code is not None:
+            bucket.bytecode_from_string(code)
+
+    def dump_bytecode(self, bucket: typing.Any) -> None:
+        self.storage[bucket.key] = bucket.bytecode_to_string()
+
+    def clear(self) -> None:
+        self.storage.clear()
+
+
+class TemplateEngine:
+    """
+    Jinja environments shared by all template views of one settings module.
+    Template search path and globals are set up once, compiled templates
+    are kept by environments and their bytecode cache. If "TEMPLATE_MODULES"
+    directory contains templates precompiled with "compile_templates" command
+    they are loaded first, unless auto reload is on.
+    """
+
+    def __init__(self, settings: Settings, auto_reload: bool = False) -> None:
+        self.settings = settings
+        self.auto_reload = auto_reload
+        self.template_modules = settings.get("TEMPLATE_MODULES")
+        self.bytecode_cache = self.create_bytecode_cache()
+        self.package = self.create_environment(
+            PackageLoader("crax", "templates/"), modules="package"
+        )
+        self.apps = settings.get("APPLICATIONS")
+        self.template_dirs = [".", "crax"]
+        self.applications = None
+        if self.apps:
+            for app in self.apps:
+                self.template_dirs += [
+                    root for root, _, _ in os.walk(app) if "templates" in root
+                ]
+            self.applications = self.create_environment(
+                FileSystemLoader(self.template_dirs), modules="applications"
+            )
+
+    def create_bytecode_cache(self) -> BytecodeCache:
+        bytecode_cache = self.settings.get("TEMPLATE_BYTECODE_CACHE")
+        if isinstance(bytecode_cache, BytecodeCache):
+            return bytecode_cache
+        elif isinstance(bytecode_cache, str):
+            os.makedirs(bytecode_cache, exist_ok=True)
+            return FileSystemBytecodeCache(bytecode_cache)
+        return MemoryBytecodeCache()
+
+    def create_environment(
+        self, loader: typing.Any, modules: str = None
+    ) -> Environment:
+        if self.template_modules and modules and self.auto_reload is not True:
+            path = os.path.join(self.template_modules, modules)
+            if os.path.isdir(path):
+                loader = ChoiceLoader([ModuleLoader(path), loader])
+        env = Environment(
+            loader=loader,
+            autoescape=True,
+            enable_async=True,
+            auto_reload=self.auto_reload,
+            bytecode_cache=self.bytecode_cache,
+        )
+        env.globals.update(url=url)
+        env.globals.update(csrf_token=csrf_token)
+        custom_functions = self.settings.get("TEMPLATE_FUNCTIONS")
+        if custom_functions and isinstance(custom_functions, list):
+            for func in custom_functions:
+                env.globals.update(**{func.__name__: func})
+        return env
+
+    def compile_templates(self, target: str) -> None:
+        package = self.create_environment(PackageLoader("crax", "templates/"))
+        package.compile_templates(os.path.join(target, "package"), zip=None)
+        if self.apps:
+            app_dirs = [x for x in self.template_dirs if x not in [".", "crax"]]
+            applications = self.create_environment(FileSystemLoader(app_dirs))
+            applications.compile_templates(
+                os.path.join(target, "applications"), zip=None
+            )
+
+
+_template_engines = {}
+
+
+def get_template_engine(
+    settings: Settings = None, auto_reload: bool = None
+) -> TemplateEngine:
+    if settings is None:
+        settings = get_settings_snapshot()
+    engine = _template_engines.get(settings.module)
+    if (
+        engine is None
+        or engine.settings is not settings
+        or (auto_reload is not None and engine.auto_reload != auto_reload)
+    ):
+        if auto_reload is None:
+            auto_reload = settings.get("TEMPLATE_AUTO_RELOAD", False) is True
+        engine = TemplateEngine(settings, auto_reload=auto_reload)
+        _template_engines[settings.module] = engine
+    return engine
+
+
 class BaseView:
     methods = ["GET"]
     login_required = False
     staff_only = False
     superuser_only = False
+    permissions_required = []
     enable_csrf = True
 
     def __init__(
@@ -165,8 +280,17 @@ class JSONView(BaseView):
         super(JSONView, self).__init__(request, **kwargs)
         self.get_status_code()
 
-    async def create_context(self) -> JSONResponse:
-        response = JSONResponse(self.request, self.context, status_code=self.status_code)
+    async def create_context(
+        self,
+    ) -> typing.Union[JSONResponse, StreamingJSONResponse]:
+        if hasattr(self.context, "__aiter__"):
+            response = StreamingJSONResponse(
+                self.request, self.context, status_code=self.status_code
+            )
+        else:
+            response = JSONResponse(
+                self.request, self.context, status_code=self.status_code
+            )
         return response
 
     async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
@@ -211,7 +335,8 @@ class TemplateView(BaseView):
         super(TemplateView, self).__init__(request=None, **kwargs)
         self.request = request
         self.kwargs = kwargs
-        self.apps = get_settings_variable("APPLICATIONS")
+        self.settings = getattr(request, "settings", None)
+        self.apps = get_settings_variable("APPLICATIONS", settings=self.settings)
         self.get_status_code()
 
     def format_traceback(self, trace: ExceptionType) -> None:
@@ -232,46 +357,20 @@ class TemplateView(BaseView):
         )
 
     def get_template(self) -> Template:
-
+        engine = get_template_engine(self.settings)
         if (
-            not self.apps
+            engine.applications is None
             or "error_message" in self.kwargs
             or self.template in ["default.html", "swagger.html"]
         ):
-            env = Environment(
-                loader=PackageLoader("crax", "templates/"),
-                autoescape=True,
-                enable_async=True,
-            )
-            template = env.get_template(self.template)
+            env = engine.package
         else:
-            template_dirs = [".", "crax"]
-            for app in self.apps:
-                template_dirs += [
-                    root for root, _, _ in os.walk(app) if "templates" in root
-                ]
-            env = Environment(
-                loader=FileSystemLoader(template_dirs),
-                autoescape=True,
-                enable_async=True,
-            )
-            template = env.get_template(self.template)
-        env.globals.update(url=url)
-        env.globals.update(csrf_token=csrf_token)
-        custom_functions = get_settings_variable("TEMPLATE_FUNCTIONS")
-        if custom_functions and isinstance(custom_functions, list):
-            for func in custom_functions:
-                env.globals.update(**{func.__name__: func})
-        return template
+            env = engine.applications
+        return env.get_template(self.template)
 
     async def create_error_content(self, ex: ExceptionType, status_code: int) -> str:
         self.status_code = status_code
-        env = Environment(
-            loader=PackageLoader("crax", "templates/"),
-            autoescape=True,
-            enable_async=True,
-        )
-        template = env.get_template("error.html")
+        template = get_template_engine(self.settings).package.get_template("error.html")
         self.format_traceback(ex)
         content = await template.render_async(**self.context)
         return content
@@ -318,12 +417,9 @@ class DefaultError(TemplateView):
         super(DefaultError, self).__init__(request, **kwargs)
 
     async def render_response(self) -> TextResponse:
-        env = Environment(
-            loader=PackageLoader("crax", "templates/"),
-            enable_async=True,
-            autoescape=True,
+        template = get_template_engine(self.settings).package.get_template(
+            self.template
         )
-        template = env.get_template(self.template)
         self.format_traceback(self.ex)
         content = await template.render_async(**self.context)
         response = TextResponse(self.request, content, status_code=self.status_code)
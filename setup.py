@@ -39,6 +39,7 @@ setup(
         ],
         "mysql": ["sqlalchemy", "databases", "alembic", "aiomysql", "pymysql==0.9.2"],
         "sqlite": ["sqlalchemy", "databases", "alembic", "aiosqlite"],
+        "brotli": ["brotli"],
     },
     include_package_data=True,
     classifiers=[
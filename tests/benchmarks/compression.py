@@ -0,0 +1,71 @@
+"""
+Bytes saved vs CPU time of CompressionMiddleware compressors. Run from
+project root: python -m tests.benchmarks.compression
+"""
+import json
+import os
+import time
+
+from crax.middleware.compression import get_compressors
+
+LEVELS = {"gzip": [1, 6, 9], "br": [1, 4, 11], "zstd": [1, 3, 10]}
+CHUNK_SIZE = 4096
+ROUNDS = 5
+
+
+def get_payloads() -> dict:
+    crax_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+    rows = [
+        {"id": x, "username": f"user_{x}", "email": f"user_{x}@example.com"}
+        for x in range(5000)
+    ]
+    payloads = {"json rows": json.dumps(rows).encode()}
+    for name in [
+        "crax/swagger/static/swagger-ui-bundle.js",
+        "crax/templates/error.html",
+    ]:
+        with open(os.path.join(crax_dir, name), "rb") as file:
+            payloads[os.path.basename(name)] = file.read()
+    return payloads
+
+
+def measure(compressor_class: type, level: int, payload: bytes, stream: bool):
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        compressor = compressor_class(level)
+        size = 0
+        if stream is True:
+            for x in range(0, len(payload), CHUNK_SIZE):
+                size += len(compressor.compress(payload[x : x + CHUNK_SIZE]))
+                size += len(compressor.flush())
+        else:
+            size += len(compressor.compress(payload))
+        size += len(compressor.finish())
+    elapsed = (time.perf_counter() - started) / ROUNDS
+    return size, elapsed
+
+
+def main() -> None:
+    compressors = get_compressors()
+    header = (
+        f'{"payload":<24}{"encoding":<10}{"level":>6}{"mode":>8}'
+        f'{"size":>12}{"saved":>9}{"ms":>9}{"MB/s":>9}'
+    )
+    print(header)
+    print("-" * len(header))
+    for name, payload in get_payloads().items():
+        for encoding, compressor_class in compressors.items():
+            for level in LEVELS[encoding]:
+                for stream in [False, True]:
+                    size, elapsed = measure(compressor_class, level, payload, stream)
+                    saved = 100 - size * 100 / len(payload)
+                    speed = len(payload) / elapsed / 1024 / 1024
+                    print(
+                        f"{name:<24}{encoding:<10}{level:>6}"
+                        f'{"stream" if stream else "body":>8}{size:>12}'
+                        f"{saved:>8.1f}%{elapsed * 1000:>9.2f}{speed:>9.1f}"
+                    )
+
+
+if __name__ == "__main__":
+    main()
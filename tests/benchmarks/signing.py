@@ -0,0 +1,53 @@
+"""
+Per-request cost of signing: new TimestampSigner for every session check,
+CSRF token and anonymous cookie vs shared SigningService. Run from project
+root: python -m tests.benchmarks.signing
+"""
+import time
+import typing
+from base64 import b64decode, b64encode
+
+import itsdangerous
+
+from crax.signing import SigningService
+
+SECRET = "qwerty1234567"
+ROUNDS = 20000
+
+
+def request_with_new_signers(session: bytes) -> None:
+    # Auth and session middleware check cookie, view renders CSRF token
+    # and session middleware signs anonymous cookie
+    for _ in range(2):
+        itsdangerous.TimestampSigner(SECRET).unsign(session, max_age=1209600)
+    b64encode(itsdangerous.TimestampSigner(SECRET).sign(str(int(time.time()))))
+    b64encode(itsdangerous.TimestampSigner(SECRET).sign(str(int(time.time()))))
+
+
+def request_with_service(session: bytes, signer: SigningService) -> None:
+    for _ in range(2):
+        signer.unsign(session, max_age=1209600)
+    b64encode(signer.sign(str(int(time.time()))))
+
+
+def measure(func: typing.Callable, *args: typing.Any) -> float:
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        func(*args)
+    return (time.perf_counter() - started) / ROUNDS * 1000000
+
+
+def main() -> None:
+    session = b64decode(b64encode(itsdangerous.TimestampSigner(SECRET).sign("mark:1")))
+    before = measure(request_with_new_signers, session)
+    after = measure(request_with_service, session, SigningService(SECRET))
+    rotated = SigningService("new_secret", [SECRET])
+    fallback = measure(request_with_service, session, rotated)
+    print(f'{"new signers":<28}{before:>8.1f} us/request')
+    print(f'{"signing service":<28}{after:>8.1f} us/request')
+    print(f'{"service, old secret cookie":<28}{fallback:>8.1f} us/request')
+    print(f'{"saved":<28}{before - after:>8.1f} us/request')
+
+
+if __name__ == "__main__":
+    main()
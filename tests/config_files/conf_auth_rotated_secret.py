@@ -0,0 +1,7 @@
+try:
+    from config_files.conf_auth_right import *  # noqa: F401,F403
+except ImportError:
+    from .conf_auth_right import *  # noqa: F401,F403
+
+SECRET_KEY = "rotated7654321"
+SECRET_KEY_FALLBACKS = ["qwerty1234567"]
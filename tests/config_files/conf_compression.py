@@ -0,0 +1,23 @@
+import os
+
+try:
+    from test_app_common.routers import streaming_view
+    from test_app_common.urls_two_apps import url_list
+except ImportError:
+    from ..test_app_common.routers import streaming_view
+    from ..test_app_common.urls_two_apps import url_list
+from crax.urls import Route, Url
+
+ALLOWED_HOSTS = ["*"]
+BASE_URL = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SECRET_KEY = "qwerty1234567"
+MIDDLEWARE = [
+    "crax.middleware.compression.CompressionMiddleware",
+]
+
+APPLICATIONS = ["test_app_common", "test_app_nested"]
+URL_PATTERNS = url_list + [Route(Url("/streaming_view"), streaming_view)]
+STATIC_DIRS = ["static", "test_app_common/static"]
+
+DATABASES = {}
+COMPRESSION_OPTIONS = {"min_size": 100, "level": 9, "encodings": ["gzip"]}
@@ -8,7 +8,7 @@ from crax.auth.authentication import logout
 from crax.auth.models import User
 from crax.response_types import JSONResponse, TextResponse
 from crax.utils import get_settings_variable
-from crax.views import TemplateView, BaseView
+from crax.views import TemplateView, BaseView, JSONView
 from .models import Customer
 
 
@@ -117,11 +117,31 @@ class InsertView(TemplateView):
         after_users = await User.query.all()
         response = JSONResponse(
             self.request,
-            {"len_before": len(before_users), "len_after": len(after_users)},
+            {
+                "len_before": len(before_users),
+                "len_after": len(after_users),
+                "batches": [len(x) async for x in User.query.chunks(chunk_size=2)],
+            },
         )
         return response
 
 
+class RawUsersView(JSONView):
+    methods = ["GET"]
+
+    async def get(self):
+        users = await User.query.all(raw=True)
+        first_user = await User.query.first(raw=True)
+        self.context = {"first_user": first_user, "users": users}
+
+
+class ExportView(JSONView):
+    methods = ["GET"]
+
+    async def get(self):
+        self.context = User.query.iterate(raw=True)
+
+
 class WrongInsertView(TemplateView):
     template = "index.html"
     methods = ["GET"]
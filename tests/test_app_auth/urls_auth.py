@@ -11,6 +11,8 @@ from .routers import (
     AnonymousSessionView,
     CreateView,
     InsertView,
+    RawUsersView,
+    ExportView,
     WrongInsertView,
     WrongMethodInsertView,
     WrongTableMethodView,
@@ -27,6 +29,8 @@ url_list = [
     Route(Url("/anonymous_session"), AnonymousSessionView),
     Route(Url("/create"), CreateView),
     Route(Url("/insert"), InsertView),
+    Route(Url("/raw_users"), RawUsersView),
+    Route(Url("/export"), ExportView),
     Route(Url("/wrong_insert"), WrongInsertView),
     Route(Url("/wrong_method_insert"), WrongMethodInsertView),
     Route(Url("/wrong_table_method"), WrongTableMethodView),
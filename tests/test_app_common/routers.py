@@ -1,7 +1,7 @@
 import json
 import sys
 
-from crax.response_types import JSONResponse, TextResponse
+from crax.response_types import JSONResponse, StreamingResponse, TextResponse
 from crax.views import TemplateView, WsView
 from jinja2 import Environment, PackageLoader
 
@@ -112,6 +112,16 @@ async def guest_coroutine_view(request, scope, receive, send):
     await response(scope, receive, send)
 
 
+async def streaming_view(request, scope, receive, send):
+    async def content():
+        for x in range(100):
+            yield f"Streaming chunk {x}\n"
+
+    response = StreamingResponse(request, content(), media_type="text/plain")
+    response.headers.append((b"content-type", b"text/plain; charset=utf-8"))
+    await response(scope, receive, send)
+
+
 class ZeroDivision(TemplateView):
     template = "index.html"
     methods = ["GET"]
@@ -1,4 +1,5 @@
 import asyncio
+import json
 import os
 import random
 import re
@@ -10,7 +11,7 @@ import pytest
 import requests
 from crax import get_settings
 from crax.utils import get_settings_variable
-from .utils import SimpleResponseTest
+from .utils import SimpleResponseTest, call_app, run_app, split_response
 import websockets
 from crax import Crax
 from uvicorn import Server, Config
@@ -931,20 +932,27 @@ async def test_first_app_logger_custom_error():
     )
 
 
-@pytest.mark.asyncio
-async def test_first_app_middleware_error():
-    def middleware_error(host):
-        time.sleep(1)
-        resp = requests.get(host)
-        assert resp.status_code == 500
-        assert "<h2>AttributeError</h2>" in resp.content.decode("utf-8")
-
-    await SimpleResponseTest(
-        middleware_error,
-        "http://127.0.0.1:8000/",
-        settings="tests.config_files.conf_middleware_error",
-        debug=True,
-    )
+def test_first_app_middleware_error():
+    app = Crax(settings="tests.config_files.conf_middleware_error", debug=True)
+    startup = [{"type": "lifespan.startup"}]
+    messages = run_app(app, {"type": "lifespan"}, received=startup)
+    assert messages[0]["type"] == "lifespan.startup.failed"
+    assert "MIDDLEWARE ERROR" in messages[0]["message"]
+    assert "XF" in messages[0]["message"]
+
+    # Without lifespan protocol error is reported for every request
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "query_string": b"",
+        "headers": [],
+        "server": ("127.0.0.1", 8000),
+        "client": ("127.0.0.1", 10000),
+    }
+    status, _, body = split_response(run_app(app, scope))
+    assert status == 500
+    assert "<h2>AttributeError</h2>" in body.decode("utf-8")
 
 
 @pytest.mark.asyncio
@@ -1518,6 +1526,709 @@ async def test_first_app_nested_follow_created_urls():
     )
 
 
+def test_router_same_as_routes_scan():
+    from crax.request import Request
+    from crax.urls import Router
+    from crax.utils import unpack_urls
+    from tests.test_app_common.urls_two_apps import url_list
+
+    router = Router(url_list)
+    paths = [
+        "/",
+        "/guest_view",
+        "/post_view_render/",
+        "/tests/test_app_nested/test_param/value_1/value_2/",
+        "/tests/test_app_nested/test_param_regex/value_1/value_2/",
+        "/tests/test_app_nested/test_json_view",
+        "/tests/test_app_nested/leagueA/first_league/",
+        "/tests/test_app_nested/leagueA/teams/first_league/Penguins/",
+        "/tests/test_app_nested/leagueA/teams/players/first_league/Penguins/Crosby/87",
+        "/tests/test_app_nested/leagueA/teams/players/first_league_scores/Oilers/Tippett/",
+        "/tests/test_app_nested/test_masquerade/masquerade_1.html",
+        "/missed/path/",
+    ]
+    for path in paths:
+        scope = {
+            "type": "http",
+            "path": path,
+            "headers": [],
+            "server": ("", 0),
+            "client": ("", 0),
+        }
+        scanned = Request(scope)
+        handler = None
+        for route in unpack_urls(url_list):
+            handler = route.get_match(scanned)
+            if handler is not None:
+                break
+        routed = Request(scope)
+        assert router.resolve(routed) == handler
+        assert routed.params == scanned.params
+
+
+def test_router_regex_order_and_wrong_url():
+    from crax.request import Request
+    from crax.exceptions import CraxImproperlyConfigured
+    from crax.urls import Route, Router, Url
+
+    class First:
+        pass
+
+    class Second:
+        pass
+
+    def resolve(router, path):
+        scope = {
+            "type": "http",
+            "path": path,
+            "headers": [],
+            "server": ("", 0),
+            "client": ("", 0),
+        }
+        request = Request(scope)
+        handler = router.resolve(request)
+        resolve.params = request.params
+        return handler
+
+    urls = [
+        Url(r"/items/(?P<pk>\d+)/", type="re_path"),
+        Url(r"/items/(?P<name>\w+)/", type="re_path"),
+    ]
+    router = Router([Route(urls, First)])
+    assert resolve(router, "/items/1/") is First
+    assert resolve.params == {"name": "1"}
+    routes = [
+        Route(Url(r"/items/(?P<pk>\d+)/", type="re_path"), First),
+        Route(Url("/items/<pk>/"), Second),
+    ]
+    assert resolve(Router(routes), "/items/1/") is First
+    assert resolve(Router(routes[::-1]), "/items/1/") is Second
+
+    router = Router([Route(Url("/first/"), First), Route(["/wrong/"], Second)])
+    assert resolve(router, "/first/") is First
+    with pytest.raises(CraxImproperlyConfigured):
+        resolve(router, "/second/")
+    router = Router([Route(["/wrong/", Url("/first/")], First)])
+    assert resolve(router, "/first/") is First
+    with pytest.raises(CraxImproperlyConfigured):
+        resolve(router, "/second/")
+
+
+def test_settings_snapshot():
+    import dataclasses
+    from crax.utils import Settings, get_settings_snapshot, reload_settings
+
+    settings = "tests.config_files.conf_minimal"
+    snapshot = get_settings_snapshot(settings)
+    assert isinstance(snapshot, Settings)
+    assert snapshot is get_settings_snapshot(settings)
+    assert snapshot.SECRET_KEY == "qwerty1234567"
+    assert snapshot.get("MISSED_VARIABLE", "default") == "default"
+    assert get_settings_variable("SECRET_KEY", settings=snapshot) == "qwerty1234567"
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        snapshot.SECRET_KEY = "changed"
+    assert snapshot.SECRET_KEY == "qwerty1234567"
+    reloaded = reload_settings(settings)
+    assert reloaded is not snapshot
+    assert reloaded is get_settings_snapshot(settings)
+    assert reloaded == snapshot
+
+    app = Crax(settings=settings)
+    config = app.config
+    assert config.module == settings
+    assert app.reload_settings() is not config
+    assert app.config is get_settings_snapshot(settings)
+
+
+def test_middleware_chain():
+    from crax.exceptions import CraxImproperlyConfigured
+    from crax.middleware.base import MiddlewareChain
+    from crax.middleware.cors import CorsHeadersMiddleware
+    from crax.middleware.x_frame import XFrameMiddleware
+
+    chain = MiddlewareChain(
+        [
+            "crax.middleware.cors.CorsHeadersMiddleware",
+            "crax.middleware.x_frame.XFrameMiddleware",
+        ]
+    )
+    assert chain.error is None
+    assert chain.request_middleware == [XFrameMiddleware]
+    assert chain.response_middleware == [CorsHeadersMiddleware]
+
+    chain = MiddlewareChain(["crax.middleware.x_frame.XF"])
+    assert isinstance(chain.error, AttributeError)
+    assert chain.request_middleware == []
+
+    chain = MiddlewareChain(
+        ["crax.middleware.x_frame.XFrameMiddleware", "crax.request.Request"]
+    )
+    assert isinstance(chain.error, CraxImproperlyConfigured)
+    assert "should be subclass of RequestMiddleware" in str(chain.error)
+    assert chain.request_middleware == []
+
+
+def test_template_engine_cached():
+    from crax.utils import Settings
+    from crax.views import MemoryBytecodeCache, get_template_engine
+
+    def square_(x):
+        return x * x
+
+    def hello():
+        return "Hello"
+
+    settings = Settings(
+        module="test_template_engine",
+        variables={
+            "APPLICATIONS": ["test_app_common"],
+            "TEMPLATE_FUNCTIONS": [square_, hello],
+        },
+    )
+    engine = get_template_engine(settings)
+    assert engine is get_template_engine(settings)
+    assert engine.auto_reload is False
+    assert isinstance(engine.bytecode_cache, MemoryBytecodeCache)
+    for env in [engine.package, engine.applications]:
+        assert {"url", "csrf_token", "square_", "hello"}.issubset(env.globals)
+        assert env.auto_reload is False
+    template = engine.package.get_template("error.html")
+    assert template is engine.package.get_template("error.html")
+    assert engine.bytecode_cache.storage
+
+    debug_engine = get_template_engine(settings, auto_reload=True)
+    assert debug_engine is not engine
+    assert debug_engine.package.auto_reload is True
+    assert debug_engine is get_template_engine(settings)
+
+
+def test_template_engine_precompiled(tmp_path):
+    from crax.utils import Settings
+    from crax.views import TemplateEngine
+
+    variables = {"APPLICATIONS": ["test_app_common"]}
+    target = str(tmp_path / "compiled")
+    TemplateEngine(Settings("test_compile_templates", variables)).compile_templates(
+        target
+    )
+    assert os.listdir(os.path.join(target, "package"))
+    assert os.listdir(os.path.join(target, "applications"))
+
+    variables["TEMPLATE_MODULES"] = target
+    settings = Settings("test_compile_templates", variables)
+    engine = TemplateEngine(settings)
+    source_engine = TemplateEngine(settings, auto_reload=True)
+    for name, env, source_env in [
+        ("error.html", engine.package, source_engine.package),
+        ("index.html", engine.applications, source_engine.applications),
+    ]:
+        template = env.get_template(name)
+        assert template.filename.startswith(target)
+        source_template = source_env.get_template(name)
+        assert not source_template.filename.startswith(target)
+        assert template.render(status_code=500) == source_template.render(
+            status_code=500
+        )
+
+
+def test_file_response_send_modes(tmp_path):
+    from crax.response_types import FileResponse
+
+    path = tmp_path / "static.js"
+    content = os.urandom(200000)
+    path.write_bytes(content)
+
+    def call(extensions=None, **kwargs):
+        scope = {"type": "http", "headers": []}
+        if extensions is not None:
+            scope["extensions"] = extensions
+        return run_app(FileResponse(str(path), **kwargs), scope)
+
+    messages = call()
+    assert messages[0]["status"] == 200
+    assert dict(messages[0]["headers"])[b"content-length"] == b"200000"
+    assert len(messages) == 5
+    assert b"".join(x["body"] for x in messages[1:]) == content
+    assert messages[-1]["more_body"] is False
+
+    messages = call(chunk_size=100000)
+    assert len(messages) == 4
+    assert b"".join(x["body"] for x in messages[1:]) == content
+
+    messages = call({"http.response.pathsend": {}})
+    assert messages[1] == {"type": "http.response.pathsend", "path": str(path)}
+
+    messages = call({"http.response.zerocopy": {}})
+    assert messages[1]["type"] == "http.response.zerocopy"
+    assert messages[1]["body"] == content
+
+
+def test_file_response_ranges(tmp_path):
+    from crax.response_types import FileResponse
+
+    path = tmp_path / "video.mp4"
+    content = os.urandom(100000)
+    path.write_bytes(content)
+
+    def call(headers, extensions=None):
+        scope = {"type": "http", "headers": headers}
+        if extensions is not None:
+            scope["extensions"] = extensions
+        response = FileResponse(str(path), chunk_size=4096)
+        status, headers, body = split_response(run_app(response, scope))
+        assert int(headers[b"content-length"]) == len(body)
+        return status, headers, body
+
+    status, headers, body = call([])
+    assert status == 200
+    assert headers[b"accept-ranges"] == b"bytes"
+    assert body == content
+
+    for range_header, expected in [
+        (b"bytes=100-5099", content[100:5100]),
+        (b"bytes=99000-", content[99000:]),
+        (b"bytes=-500", content[-500:]),
+        (b"bytes=0-10,5-20", content[:21]),
+    ]:
+        for extensions in [None, {"http.response.zerocopy": {}}]:
+            status, headers, body = call([(b"range", range_header)], extensions)
+            assert status == 206
+            assert body == expected
+            assert headers[b"content-range"].endswith(b"/100000")
+
+    status, headers, body = call([(b"range", b"bytes=0-99,-100")])
+    assert status == 206
+    content_type = headers[b"content-type"].decode()
+    assert content_type.startswith("multipart/byteranges; boundary=")
+    boundary = content_type.split("boundary=")[1].encode()
+    parts = body.split(b"--" + boundary)
+    assert parts[0] == b"" and parts[-1] == b"--\r\n"
+    assert parts[1].endswith(b"\r\n\r\n" + content[:100] + b"\r\n")
+    assert b"Content-Range: bytes 0-99/100000" in parts[1]
+    assert parts[2].endswith(b"\r\n\r\n" + content[-100:] + b"\r\n")
+    assert b"Content-Range: bytes 99900-99999/100000" in parts[2]
+
+    status, headers, body = call([(b"range", b"bytes=100000-")])
+    assert status == 416
+    assert headers[b"content-range"] == b"bytes */100000"
+
+    status, headers, body = call([(b"range", b"lines=1-2")])
+    assert status == 200 and body == content
+
+    _, full_headers, _ = call([])
+    for if_range, expected_status in [
+        (full_headers[b"etag"], 206),
+        (b'"' + full_headers[b"etag"] + b'"', 206),
+        (full_headers[b"last-modified"], 206),
+        (b"outdated", 200),
+        (b"Wed, 21 Oct 2015 07:28:00 GMT", 200),
+    ]:
+        status, _, _ = call([(b"range", b"bytes=0-9"), (b"if-range", if_range)])
+        assert status == expected_status
+
+
+def test_static_files_registry(tmp_path):
+    from crax.response_types import FileResponse
+    from crax.static import StaticFiles
+
+    static_dir = tmp_path / "static" / "css"
+    static_dir.mkdir(parents=True)
+    for name, size in [("a.css", 100), ("b.css", 200), ("c.css", 300)]:
+        (static_dir / name).write_bytes(b"x" * size)
+    (tmp_path / "other.js").write_bytes(b"y" * 10)
+
+    static_files = StaticFiles(
+        static_dirs=["static"],
+        base_url=str(tmp_path),
+        debug=True,
+        memory_budget=500,
+        memory_file_size=250,
+    )
+
+    def get(path):
+        loop = asyncio.get_event_loop()
+        return loop.run_until_complete(static_files.get(path))
+
+    assert "/static/css/a.css" in static_files.assets
+    assert "/swagger/static/swagger-ui.css" in static_files.assets
+    asset = get("/static/css/a.css")
+    assert asset.path == str(static_dir / "a.css")
+    assert asset.content_type == "text/css"
+    response = FileResponse(asset.path, static_res=asset.stat_result)
+    assert list(asset.headers) == response.headers
+    assert asset.content == b"x" * 100
+
+    assert get("/static/css/b.css").content == b"x" * 200
+    assert get("/static/css/c.css").content is None
+    assert get("/static/css/a.css").content == b"x" * 100
+    (static_dir / "c.css").write_bytes(b"z" * 250)
+    os.utime(static_dir / "c.css", (1, 1))
+    assert get("/static/css/c.css").content == b"z" * 250
+    assert static_files.memory_size == 350
+    assert list(static_files.memory) == [
+        str(static_dir / "a.css"),
+        str(static_dir / "c.css"),
+    ]
+
+    static_files.memory.clear()
+    static_files.memory_size = 0
+
+    async def get_concurrently(path):
+        return await asyncio.gather(static_files.get(path), static_files.get(path))
+
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(get_concurrently("/static/css/a.css"))
+    assert static_files.memory_size == 100
+    assert static_files.memory_size == sum(
+        len(x) for x in static_files.memory.values()
+    )
+
+    (static_dir / "b.css").unlink()
+    assert get("/static/css/b.css") is None
+    assert get("/static/css/missed.css") is None
+    assert "/other.js" not in static_files.assets
+    assert get("/other.js").path == str(tmp_path) + "/other.js"
+    assert "/other.js" in static_files.assets
+
+
+def test_static_files_precompressed(tmp_path):
+    import gzip
+    from crax.response_types import FileResponse
+    from crax.static import StaticFiles
+
+    static_dir = tmp_path / "static"
+    static_dir.mkdir()
+    content = b"body { color: red; }\n" * 100
+    (static_dir / "style.css").write_bytes(content)
+    (static_dir / "small.css").write_bytes(b"a {}")
+    (static_dir / "image.png").write_bytes(os.urandom(1000))
+
+    static_files = StaticFiles(static_dirs=["static"], base_url=str(tmp_path))
+    static_files.assets = {
+        k: v for k, v in static_files.assets.items() if k.startswith("/static/")
+    }
+    created = static_files.compress()
+    assert str(static_dir / "style.css.gz") in created
+    assert not (static_dir / "small.css.gz").exists()
+    assert not (static_dir / "image.png.gz").exists()
+    assert static_files.compress() == []
+
+    static_files = StaticFiles(static_dirs=["static"], base_url=str(tmp_path))
+    assert "/static/style.css.gz" not in static_files.assets
+    loop = asyncio.get_event_loop()
+    assert loop.run_until_complete(static_files.get("/static/style.css.gz")) is None
+    (static_dir / "archive.tar.gz").write_bytes(b"archive")
+    archive = loop.run_until_complete(static_files.get("/static/archive.tar.gz"))
+    assert archive.path == str(static_dir / "archive.tar.gz")
+    asset = loop.run_until_complete(static_files.get("/static/style.css"))
+    assert [x[0] for x in asset.sidecars] == ["gzip"]
+
+    def call(headers, **kwargs):
+        scope = {"type": "http", "headers": headers}
+        return split_response(run_app(FileResponse(**kwargs), scope))
+
+    for kwargs in [
+        {"path": asset.path, "asset": asset},
+        {"path": str(static_dir / "style.css")},
+    ]:
+        accept_encoding = [(b"accept-encoding", b"gzip, deflate, br")]
+        status, headers, body = call(accept_encoding, **kwargs)
+        assert status == 200
+        assert headers[b"content-encoding"] == b"gzip"
+        assert headers[b"vary"] == b"accept-encoding"
+        assert headers[b"content-type"] == b"text/css"
+        assert headers[b"etag"].endswith(b"-gzip")
+        assert int(headers[b"content-length"]) == len(body)
+        assert gzip.decompress(body) == content
+
+        for request_headers in [
+            [],
+            [(b"accept-encoding", b"gzip;q=0, deflate")],
+            [(b"accept-encoding", b"gzip"), (b"range", b"bytes=0-9")],
+        ]:
+            status, headers, body = call(request_headers, **kwargs)
+            assert b"content-encoding" not in headers
+            assert headers[b"vary"] == b"accept-encoding"
+            assert content.startswith(body)
+
+
+@pytest.mark.asyncio
+async def test_compression_middleware():
+    settings = "tests.config_files.conf_compression"
+
+    def compressed(host):
+        time.sleep(1)
+        data = {"data": "Test compression " * 100}
+        resp = requests.post(
+            f"{host}/post_view", data=data, headers={"Accept-Encoding": "gzip"}
+        )
+        assert resp.status_code == 200
+        assert resp.headers["content-encoding"] == "gzip"
+        assert resp.headers["vary"] == "Accept-Encoding"
+        assert int(resp.headers["content-length"]) < len(resp.content)
+        assert resp.json() == data
+
+        resp = requests.post(
+            f"{host}/post_view", data=data, headers={"Accept-Encoding": "identity"}
+        )
+        assert "content-encoding" not in resp.headers
+        assert resp.json() == data
+
+        resp = requests.post(
+            f"{host}/post_view",
+            data={"data": "Short"},
+            headers={"Accept-Encoding": "gzip"},
+        )
+        assert "content-encoding" not in resp.headers
+        assert resp.json() == {"data": "Short"}
+
+        resp = requests.get(
+            f"{host}/streaming_view", headers={"Accept-Encoding": "gzip"}, stream=True
+        )
+        assert resp.headers["content-encoding"] == "gzip"
+        assert "content-length" not in resp.headers
+        content = resp.raw.read(decode_content=True).decode()
+        assert content == "".join(f"Streaming chunk {x}\n" for x in range(100))
+
+        resp = requests.get(
+            f"{host}/test_app_common/static/bootstrap.css",
+            headers={"Accept-Encoding": "gzip"},
+        )
+        assert resp.status_code == 200
+        assert resp.headers["content-encoding"] == "gzip"
+        assert resp.headers["etag"].endswith("-gzip")
+
+    await SimpleResponseTest(compressed, "http://127.0.0.1:8000", settings=settings)
+
+
+def test_json_serializers():
+    import datetime
+    import decimal
+    import uuid
+    from crax.exceptions import CraxImproperlyConfigured
+    from crax.response_types import JSONResponse
+    from crax.serializers import get_serializer, json_dumps
+    from crax.utils import Settings
+
+    class Row:
+        def __init__(self, **kwargs):
+            self.data = kwargs
+
+        def keys(self):
+            return self.data.keys()
+
+        def __getitem__(self, key):
+            return self.data[key]
+
+    value = {
+        "date": datetime.date(2020, 1, 2),
+        "created": datetime.datetime(2020, 1, 2, 3, 4, 5),
+        "price": decimal.Decimal("1.10"),
+        "id": uuid.UUID(int=1),
+        "rows": [Row(id=1, name="Привет")],
+        "tags": {"a"},
+    }
+    serializer = get_serializer("json")
+    assert serializer is get_serializer("json")
+    assert json.loads(serializer(value)) == {
+        "date": "2020-01-02",
+        "created": "2020-01-02T03:04:05",
+        "price": "1.10",
+        "id": "00000000-0000-0000-0000-000000000001",
+        "rows": [{"id": 1, "name": "Привет"}],
+        "tags": ["a"],
+    }
+    assert json.loads(get_serializer()(value)) == json.loads(serializer(value))
+    with pytest.raises(CraxImproperlyConfigured):
+        get_serializer("unknown.serializer")
+    with pytest.raises(TypeError):
+        serializer({"value": object()})
+
+    class FakeRequest:
+        settings = Settings(
+            module="test_json_serializers",
+            variables={"JSON_SERIALIZER": "crax.serializers.json_dumps"},
+        )
+
+    assert get_serializer("crax.serializers.json_dumps") is json_dumps
+    response = JSONResponse(FakeRequest(), {"rows": [Row(id=2)]})
+    assert response.body == b'{"rows":[{"id":2}]}'
+
+
+@pytest.mark.asyncio
+async def test_streaming_json_response():
+    import datetime
+    from crax.response_types import StreamingJSONResponse
+
+    async def rows():
+        for x in range(100):
+            yield {"id": x, "created": datetime.date(2020, 1, 1)}
+
+    scope = {"type": "http"}
+    response = StreamingJSONResponse(None, rows(), chunk_size=256)
+    messages = await call_app(response, scope)
+    assert messages[0]["status"] == 200
+    assert (b"content-type", b"application/json; charset=utf-8") in messages[0][
+        "headers"
+    ]
+    chunks = [x["body"] for x in messages[1:]]
+    assert len(chunks) > 10
+    assert all(len(x) < 512 for x in chunks)
+    body = json.loads(b"".join(chunks))
+    assert len(body) == 100
+    assert body[99] == {"id": 99, "created": "2020-01-01"}
+
+    messages = await call_app(StreamingJSONResponse(None, iter([])), scope)
+    assert b"".join(x["body"] for x in messages[1:]) == b"[]"
+    response = StreamingJSONResponse(None, ["a", 1], status_code=201)
+    messages = await call_app(response, scope)
+    assert messages[0]["status"] == 201
+    assert b"".join(x["body"] for x in messages[1:]) == b'["a",1]'
+
+
+def test_signing_service():
+    from itsdangerous import BadSignature, SignatureExpired, TimestampSigner
+    from crax.signing import SigningService, get_signer
+    from crax.utils import get_settings_snapshot
+
+    snapshot = get_settings_snapshot("tests.config_files.conf_minimal")
+    signer = get_signer(snapshot)
+    assert signer is get_signer(snapshot)
+    legacy = TimestampSigner("qwerty1234567").sign("mark:1")
+    assert signer.unsign(legacy) == b"mark:1"
+    assert signer.sign("mark:1") == legacy
+
+    rotated = SigningService("new_secret", ["qwerty1234567"])
+    assert rotated.unsign(legacy) == b"mark:1"
+    assert rotated.unsign(rotated.sign("mark:1")) == b"mark:1"
+    with pytest.raises(BadSignature):
+        signer.unsign(rotated.sign("mark:1"))
+    with pytest.raises(BadSignature):
+        SigningService("new_secret").unsign(legacy)
+    rotated.old_signers[0].get_timestamp = lambda: int(time.time()) + 100
+    with pytest.raises(SignatureExpired):
+        rotated.unsign(legacy, max_age=10)
+
+
+def test_compression_middleware_file_extensions():
+    import gzip
+
+    app = Crax(settings="tests.config_files.conf_compression")
+    path = "/test_app_common/static/bootstrap.css"
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with open(base_dir + path, "rb") as file:
+        content = file.read()
+
+    def call(headers, extensions):
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "path": path,
+            "query_string": b"",
+            "headers": headers,
+            "server": ("127.0.0.1", 8000),
+            "client": ("127.0.0.1", 10000),
+            "extensions": extensions,
+        }
+        return run_app(app, scope)
+
+    for extension in ["http.response.pathsend", "http.response.zerocopy"]:
+        messages = call([], {extension: {}})
+        assert messages[1]["type"] == extension
+        status, headers, body = split_response(messages)
+        assert status == 200
+        assert b"content-encoding" not in headers
+        if extension == "http.response.zerocopy":
+            assert body == content
+
+        messages = call([(b"accept-encoding", b"gzip")], {extension: {}})
+        assert all(x["type"] != extension for x in messages)
+        status, headers, body = split_response(messages)
+        assert status == 200
+        assert headers[b"content-encoding"] == b"gzip"
+        assert gzip.decompress(body) == content
+
+
+def test_response_middleware_dropped_file_response(tmp_path):
+    from contextlib import asynccontextmanager
+    from crax.middleware.base import ResponseMiddleware
+    from crax.response_types import FileResponse, TextResponse
+    from crax.utils import Settings
+
+    path = tmp_path / "file.txt"
+    path.write_bytes(b"x" * 100)
+    files = []
+
+    class TrackedFileResponse(FileResponse):
+        @asynccontextmanager
+        async def open_raw_file(self):
+            async with super(TrackedFileResponse, self).open_raw_file() as file:
+                files.append(file)
+                yield file
+
+    scope = {
+        "type": "http",
+        "headers": [],
+        "extensions": {"http.response.zerocopy": {}},
+    }
+
+    class FakeRequest:
+        settings = Settings(module="test_dropped_file_response", variables={})
+
+    FakeRequest.scope = scope
+
+    class App:
+        request = FakeRequest()
+
+        async def __call__(self, scope, receive, send):
+            await TrackedFileResponse(str(path))(scope, receive, send)
+
+    class DroppingMiddleware(ResponseMiddleware):
+        async def process_headers(self):
+            await super(DroppingMiddleware, self).process_headers()
+            return TextResponse(self.request, "Dropped", status_code=403)
+
+    status, _, body = split_response(run_app(DroppingMiddleware(app=App()), scope))
+    assert (status, body) == (403, b"Dropped")
+    assert len(files) == 1 and files[0].closed
+
+
+def test_concurrent_requests_isolation():
+    app = Crax(settings="tests.config_files.conf_minimal_middleware_no_auth_handlers")
+
+    async def make_request(number):
+        if number % 3 == 0:
+            scope_path, method, body = f"/missed_path_{number}/", "GET", b""
+        else:
+            scope_path, method = "/post_view", "POST"
+            body = f"data=value_{number}".encode("latin-1")
+        scope = {
+            "type": "http",
+            "method": method,
+            "path": scope_path,
+            "query_string": b"",
+            "headers": [
+                (b"content-type", b"application/x-www-form-urlencoded"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+            ],
+            "server": ("127.0.0.1", 8000),
+            "client": ("127.0.0.1", 10000 + number),
+        }
+        status, _, content = split_response(await call_app(app, scope, body))
+        return number, status, content
+
+    async def run():
+        return await asyncio.gather(*[make_request(x) for x in range(1000)])
+
+    for number, status, content in asyncio.get_event_loop().run_until_complete(run()):
+        if number % 3 == 0:
+            assert status == 404
+            assert content == b"Testing Not Found"
+        else:
+            assert status == 200
+            assert json.loads(content) == {"data": f"value_{number}"}
+
+
 async def send_websocket_message(text):
     uri = "ws://127.0.0.1:8000"
     await asyncio.sleep(1)
@@ -35,3 +35,42 @@ class SimpleResponseTest:
 
     def __await__(self):
         return self._run().__await__()
+
+
+async def call_app(app, scope, body=b"", received=None):
+    # Calls ASGI application and collects sent messages. Files sent with
+    # "http.response.zerocopy" extension are read into message body.
+    messages = []
+    if received is None:
+        received = [{"type": "http.request", "body": body, "more_body": False}]
+    received = list(received)
+
+    async def receive():
+        await asyncio.sleep(0)
+        if received:
+            return received.pop(0)
+        await asyncio.Event().wait()
+
+    async def send(message):
+        await asyncio.sleep(0)
+        if message["type"] == "http.response.zerocopy":
+            file = message["file"]
+            if "offset" in message:
+                file.seek(message["offset"])
+            count = message.get("count")
+            body = file.read() if count is None else file.read(count)
+            message = dict(message, body=body)
+        messages.append(message)
+
+    await app(scope, receive, send)
+    return messages
+
+
+def run_app(app, scope, body=b"", received=None):
+    loop = asyncio.get_event_loop()
+    return loop.run_until_complete(call_app(app, scope, body, received))
+
+
+def split_response(messages):
+    body = b"".join(x.get("body", b"") for x in messages[1:])
+    return messages[0]["status"], dict(messages[0]["headers"]), body